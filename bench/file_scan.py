@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Record scanning throughput: FileScan.scan with a process pool against
+# Text.splitter over File.streamer, counting records containing a word.
+#
+#   python bench/file_scan.py --size 4G --processes 1 4 16
+#
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xpy.Text import Text
+from xpy.File import File
+from xpy.FileScan import FileScan
+
+from text_splitter import parse_size, write_sample
+
+def match(record):
+    return 1 if b'w999 ' in record else None
+
+def sequential(path, eol):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return sum(1 for line in Text.splitter(File.streamer(fd, 1 << 16), eol) if match(line))
+    finally:
+        os.close(fd)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark FileScan.scan against Text.splitter.')
+    parser.add_argument('--size', default = '1G', help = 'bytes of input, e.g. 4G')
+    parser.add_argument('--processes', type = int, nargs = '+', default = [1, 2, 4, 8])
+    parser.add_argument('--range-size', default = '64M')
+    parser.add_argument('--path', help = 'scan this file instead of a generated one')
+    args = parser.parse_args()
+    eol = b'\n'
+    path = args.path
+    if path is None:
+        (fd, path) = tempfile.mkstemp(prefix = 'xpy-bench-')
+        os.close(fd)
+        write_sample(path, parse_size(args.size), eol)
+    try:
+        size = os.path.getsize(path)
+        runs = [('splitter', lambda: sequential(path, eol))]
+        for processes in args.processes:
+            runs.append(('scan x%d' % processes, lambda processes = processes: sum(
+                FileScan.scan(path, eol, match, processes, range_size = parse_size(args.range_size)))))
+        for (name, run) in runs:
+            t0 = time.time()
+            count = run()
+            elapsed = time.time() - t0
+            print('%-12s %10d bytes %9d matches %8.3fs %9.1f MB/s' % (
+                name, size, count, elapsed, size / max(elapsed, 1e-9) / (1 << 20)))
+    finally:
+        if args.path is None:
+            os.unlink(path)
+
+if __name__ == '__main__':
+    main()
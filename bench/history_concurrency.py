@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Shared history under many parallel consoles.
+#
+# Starts --sessions headless consoles against a temporary history repo, each
+# sharing one host cache like consoles on one machine.  Every session types
+# --lines lines, then they all exit at once.  Reports how long exiting took
+# (commit latency), how many lines didn't make it into the repo, and how many
+# commits and merge commits were made.
+#
+#   python bench/history_concurrency.py --sessions 10 20 50 100
+#   python bench/history_concurrency.py --sessions 20 --remote --detached
+#
+# --remote goes through a file:// URL, i.e. git clone/fetch/push, rather than
+# committing to the local repo in-process.
+#
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xpy.GitRepo import GitRepo
+from xpy.RepoHistory import RepoHistory
+from xpy.HistoryJournal import HistoryJournal
+
+def console(repo_url, index, line_count, is_detached, barrier, results):
+    import readline
+    RepoHistory.is_detached_commit = is_detached
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    for i in range(line_count):
+        readline.add_history('s%d_%d = %d' % (index, i, i))
+    hist.poll()
+    barrier.wait()
+    t0 = time.time()
+    hist.commit()
+    results.put(time.time() - t0)
+
+def read_repo(repo_path):
+    """Lines in the repo's history and (commit count, merge commit count)."""
+    repo = GitRepo(repo_path)
+    head = repo.read_ref('refs/heads/' + RepoHistory.branch)
+    parts = [repo.read_path(head, '.pyhistory') or b'']
+    entry = repo.find(head, 'journal')
+    if entry is not None:
+        for (name, (mode, sha)) in sorted(repo.read_tree(entry[1]).items()):
+            parts.append(repo.read_object(sha)[1])
+    lines = [line for (t, line) in HistoryJournal.parse(HistoryJournal.concat(parts))]
+    commit_count = merge_count = 0
+    seen = set()
+    pending = [head]
+    while pending:
+        sha = pending.pop()
+        if sha not in seen:
+            seen.add(sha)
+            parents = repo.read_commit(sha)['parents']
+            commit_count += 1
+            merge_count += len(parents) > 1
+            pending.extend(parents)
+    return (lines, commit_count, merge_count)
+
+def wait_for_workers(cache_dir, timeout):
+    """Wait until detached commit workers have flushed every journal segment."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        segments = []
+        for (path, dirs, files) in os.walk(cache_dir):
+            if path.endswith('.journal'):
+                segments.extend(files)
+        if not segments:
+            return True
+        time.sleep(0.1)
+    return False
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+def run(session_count, line_count, is_remote, is_detached, timeout):
+    root = tempfile.mkdtemp(prefix = 'xpy-bench-')
+    try:
+        os.environ['XDG_CACHE_HOME'] = os.path.join(root, 'cache')
+        repo_path = os.path.join(root, 'pyhist.git')
+        subprocess.check_call(['git', 'init', '-q', '--bare', repo_path])
+        subprocess.check_call(['git', '--git-dir', repo_path, 'symbolic-ref', 'HEAD', 'refs/heads/' + RepoHistory.branch])
+        repo_url = 'file://' + repo_path if is_remote else repo_path
+        barrier = multiprocessing.Barrier(session_count)
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target = console, args = (repo_url, i, line_count, is_detached, barrier, results))
+            for i in range(session_count)
+        ]
+        t0 = time.time()
+        for worker in workers:
+            worker.start()
+        latencies = [results.get(timeout = timeout) for worker in workers]
+        for worker in workers:
+            worker.join()
+        is_flushed = wait_for_workers(os.environ['XDG_CACHE_HOME'], timeout)
+        elapsed = time.time() - t0
+        (lines, commit_count, merge_count) = read_repo(repo_path)
+        expected = set('s%d_%d = %d' % (s, i, i) for s in range(session_count) for i in range(line_count))
+        lost = len(expected - set(lines))
+        print(' '.join([
+            'sessions %4d' % session_count,
+            'lines %6d' % (session_count * line_count),
+            'exit p50 %7.3fs' % percentile(latencies, 50),
+            'p90 %7.3fs' % percentile(latencies, 90),
+            'p99 %7.3fs' % percentile(latencies, 99),
+            'max %7.3fs' % max(latencies),
+            'lost %5d' % lost,
+            'commits %4d' % commit_count,
+            'merges %4d' % merge_count,
+            'total %7.3fs' % elapsed,
+            '' if is_flushed else '(workers timed out)',
+        ]))
+    finally:
+        shutil.rmtree(root)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark shared history under many parallel consoles.')
+    parser.add_argument('--sessions', type = int, nargs = '+', default = [10, 50, 100])
+    parser.add_argument('--lines', type = int, default = 20, help = 'lines typed per session')
+    parser.add_argument('--remote', action = 'store_true', help = 'sync through git with a file:// URL')
+    parser.add_argument('--detached', action = 'store_true', help = 'commit from detached workers')
+    parser.add_argument('--timeout', type = float, default = 300.0)
+    args = parser.parse_args()
+    for who in ('AUTHOR', 'COMMITTER'):
+        os.environ.setdefault('GIT_' + who + '_NAME', 'xpy-bench')
+        os.environ.setdefault('GIT_' + who + '_EMAIL', 'xpy-bench@localhost')
+    for session_count in args.sessions:
+        run(session_count, args.lines, args.remote, args.detached, args.timeout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Tab completion latency in a large namespace.
+#
+# Fills a console namespace with --names globals (like after `from numpy
+# import *` plus a session's data), then times a full completion cycle, i.e.
+# readline calling the completer with state 0, 1, ... until it returns None,
+# for prefixes matching different numbers of names.  The completer before
+# caching, which rebuilt the namespace and re-primed rlcompleter for every
+# state, is timed alongside, as is keeping the console's NameIndex up to
+# date after a statement binds a name.
+#
+#   python bench/tab_completion.py --names 50000
+#
+
+import os
+import sys
+import time
+import argparse
+import rlcompleter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xpy.XPY import XPY
+
+class Execution(object):
+    pass
+
+def uncached_completer(execution):
+    def fn(text, state):
+        combined = {}
+        combined.update(execution.g)
+        combined.update(execution.l)
+        comp = rlcompleter.Completer(combined)
+        for i in range(state + 1):
+            result = comp.complete(text, i)
+        return result.rstrip('()') if result is not None else None
+    return fn
+
+def cycle(fn, text, max_state):
+    state = 0
+    while state < max_state and fn(text, state) is not None:
+        state += 1
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark tab completion in a large namespace.')
+    parser.add_argument('--names', type = int, default = 50000)
+    parser.add_argument('--max-state', type = int, default = 200, help = 'stop a cycle after this many matches, as readline would page')
+    args = parser.parse_args()
+    import readline
+    execution = Execution()
+    execution.g = dict(('name_%05d' % i, i) for i in range(args.names))
+    execution.l = {'local_value': 0}
+    xpy = XPY()
+    xpy.setup_tab_completion(execution)
+    cached = readline.get_completer()
+    uncached = uncached_completer(execution)
+    for text in ('name_0000', 'name_000', 'name_00', 'local'):
+        for (name, fn) in (('uncached', uncached), ('cached', cached)):
+            t0 = time.time()
+            count = cycle(fn, text, args.max_state)
+            print('%-9s names %6d  text %-10s matches %4d  %9.2fms' % (name, args.names, text, count, (time.time() - t0) * 1000))
+    execution.g['new_name'] = 1
+    t0 = time.time()
+    xpy.name_index.update()
+    print('index update after binding a name  %9.2fms' % ((time.time() - t0) * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Line splitting throughput: Text.chunk_splitter against Text.splitter3.
+#
+# Writes a file of random lines (or uses --path), streams it with
+# File.streamer, or File.reader for the memoryview runs, and splits it.
+# splitter3 handles a byte at a time, so it's only run over the first
+# --old-size bytes.
+#
+#   python bench/text_splitter.py --size 4G --eol '\r\n'
+#
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xpy.Text import Text
+from xpy.File import File
+
+def parse_size(text):
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1:].upper()])
+    return int(text)
+
+def write_sample(path, size, eol):
+    rand = random.Random(0)
+    words = [('w%d' % i).encode() for i in range(1000)]
+    # a block of lines from 0 to ~200 bytes, repeated to fill the file
+    block = b''.join(b' '.join(rand.choice(words) for j in range(rand.randint(0, 40))) + eol for i in range(10000))
+    with open(path, 'wb') as outfile:
+        written = 0
+        while written < size:
+            data = block[: size - written]
+            outfile.write(data)
+            written += len(data)
+
+def measure(splitter, path, size, chunk, eol, is_pipe = False, is_reader = False):
+    if is_pipe:
+        # File.reader only maps regular files, so feed it through a pipe
+        (fd, write_fd) = os.pipe()
+        pid = os.fork()
+        if not pid:
+            os.close(fd)
+            with open(path, 'rb') as infile:
+                while os.write(write_fd, infile.read(1 << 20)):
+                    pass
+            os._exit(0)
+        os.close(write_fd)
+    else:
+        pid = None
+        fd = os.open(path, os.O_RDONLY)
+    try:
+        bufs = File.reader(fd, chunk) if is_reader else File.streamer(fd, chunk)
+        if size is not None:
+            bufs = limit(bufs, size)
+        t0 = time.time()
+        line_count = 0
+        for line in splitter(bufs, eol):
+            line_count += 1
+        return (time.time() - t0, line_count)
+    finally:
+        os.close(fd)
+        if pid:
+            os.waitpid(pid, 0)
+
+def limit(bufs, size):
+    for buf in bufs:
+        if size <= 0:
+            break
+        yield buf[:size]
+        size -= len(buf)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark Text.chunk_splitter against Text.splitter3.')
+    parser.add_argument('--size', default = '256M', help = 'bytes of input, e.g. 4G')
+    parser.add_argument('--old-size', default = '4M', help = 'bytes to run splitter3 over')
+    parser.add_argument('--chunk', default = '64K', help = 'read size')
+    parser.add_argument('--eol', default = '\\n', help = 'delimiter, with backslash escapes')
+    parser.add_argument('--path', help = 'split this file instead of a generated one')
+    args = parser.parse_args()
+    eol = args.eol.encode().decode('unicode_escape').encode('latin-1')
+    chunk = parse_size(args.chunk)
+    path = args.path
+    if path is None:
+        (fd, path) = tempfile.mkstemp(prefix = 'xpy-bench-')
+        os.close(fd)
+        write_sample(path, parse_size(args.size), eol)
+    try:
+        size = os.path.getsize(path)
+        old_size = min(size, parse_size(args.old_size))
+        for (name, splitter, limit_size, options) in (
+            ('splitter3', Text.splitter3, old_size, {}),
+            ('chunk_splitter', Text.chunk_splitter, None, {}),
+            ('  reader mmap', Text.chunk_splitter, None, {'is_reader': True}),
+            ('  reader pipe', Text.chunk_splitter, None, {'is_reader': True, 'is_pipe': True}),
+        ):
+            (elapsed, line_count) = measure(splitter, path, limit_size, chunk, eol, **options)
+            byte_count = size if limit_size is None else limit_size
+            print('%-16s %10d bytes %9d lines %8.3fs %9.1f MB/s' % (
+                name, byte_count, line_count, elapsed, byte_count / max(elapsed, 1e-9) / (1 << 20)))
+    finally:
+        if args.path is None:
+            os.unlink(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Write syscalls to render a deep traceback, with and without batching.
+#
+# Raises an exception --depth frames down, renders it with
+# XPY.print_execution_info to /dev/null, and counts the os.write and
+# os.writev calls made, which are one syscall each.
+#
+#   python bench/traceback_syscalls.py --depth 500
+#
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from xpy.XPY import XPY
+from xpy.Output import Output
+
+class Execution(object):
+    path = '<console>'
+
+def recurse(depth):
+    if depth:
+        return recurse(depth - 1)
+    raise ValueError('bottom')
+
+def count_calls(module, names, counts):
+    for name in names:
+        fn = getattr(module, name)
+        def counted(*args, **kwargs):
+            counts[counted.__name__] += 1
+            return counted.fn(*args, **kwargs)
+        counted.__name__ = name
+        counted.fn = fn
+        setattr(module, name, counted)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Count write syscalls rendering a deep traceback.')
+    parser.add_argument('--depth', type = int, default = 500)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.depth + 100))
+    try:
+        recurse(args.depth)
+    except ValueError as e:
+        execution = Execution()
+        execution.exc_info = sys.exc_info()
+    null = os.open(os.devnull, os.O_WRONLY)
+    XPY.output = Output(Output.FdTarget(null))
+    counts = {'write': 0, 'writev': 0}
+    originals = (os.write, os.writev)
+    count_calls(os, ['write', 'writev'], counts)
+    try:
+        for is_batching in (False, True):
+            XPY.output.is_batching = is_batching
+            counts.update(write = 0, writev = 0)
+            t0 = time.time()
+            for i in range(args.repeat):
+                XPY.print_execution_info(execution)
+            elapsed = (time.time() - t0) / args.repeat
+            print('%-10s depth %4d  write %6d  writev %4d  per render  %8.3fms' % (
+                'batched' if is_batching else 'unbatched', args.depth,
+                counts['write'] // args.repeat, counts['writev'] // args.repeat, elapsed * 1000))
+    finally:
+        (os.write, os.writev) = originals
+        os.close(null)
+
+if __name__ == '__main__':
+    main()
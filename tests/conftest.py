@@ -0,0 +1,10 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    # AsyncFile and its tests use async generators
+    collect_ignore.append('test_async.py')
@@ -0,0 +1,58 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import os
+import sys
+import socket
+import asyncio
+
+from xpy.AsyncFile import AsyncFile
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+def test_merge_tails_pipes_sockets_and_subprocesses():
+    async def main():
+        pipes = [os.pipe() for i in range(3)]
+        (left, right) = socket.socketpair()
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-c', 'print("one"); print("two", end = "")', stdout = asyncio.subprocess.PIPE)
+        (sock_reader, sock_writer) = await asyncio.open_connection(sock = left)
+        readers = [AsyncFile.open_pipe(read_fd) for (read_fd, write_fd) in pipes] + [sock_reader, proc.stdout]
+        for (i, (read_fd, write_fd)) in enumerate(pipes):
+            os.write(write_fd, b'p%d a\np%d ' % (i, i))
+        right.sendall(b'sock\r\n')
+        lines = []
+        async for (i, line) in AsyncFile.merge(readers, maxsize = 2):
+            lines.append((i, line))
+            if len(lines) == 3:
+                #
+                # the rest of each line arrives after reading has started
+                #
+                for (j, (read_fd, write_fd)) in enumerate(pipes):
+                    os.write(write_fd, b'b\n')
+                    os.close(write_fd)
+                right.close()
+        await proc.wait()
+        sock_writer.close()
+        return lines
+    lines = run(main())
+    assert sorted(lines) == sorted(
+        [(i, b'p%d a\n' % i) for i in range(3)] + [(i, b'p%d b\n' % i) for i in range(3)]
+        + [(3, b'sock\r\n'), (4, b'one\n'), (4, b'two')])
+    for i in range(5):
+        assert [line for (j, line) in lines if j == i] == sorted(line for (j, line) in lines if j == i)
+
+def test_lines_split_across_reads():
+    async def main():
+        reader = asyncio.StreamReader()
+        for piece in (b'ab', b'c\r', b'\nd\r', b'\n\r', b'\ne'):
+            reader.feed_data(piece)
+        reader.feed_eof()
+        return [line async for line in AsyncFile.lines(reader, b'\r\n', chunk = 3)]
+    assert run(main()) == [b'abc\r\n', b'd\r\n', b'\r\n', b'e']
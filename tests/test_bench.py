@@ -0,0 +1,28 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+from xpy.Bench import Bench
+
+def test_summarize_rejects_outliers():
+    times = [1e-6, 1.1e-6, 0.9e-6, 1.05e-6, 0.95e-6, 50e-6]
+    result = Bench.summarize('x', 10, times)
+    assert result.rejected == 1 and result.kept == 5
+    assert result.low < 1000 < result.high and abs(result.mean - 1000) < 1e-6
+
+def test_run_times_a_statement(monkeypatch):
+    monkeypatch.setattr(Bench, 'min_time', 0.001)
+    monkeypatch.setattr(Bench, 'samples', 5)
+    result = Bench.run('sorted(data)', globals = {'data': list(range(1000, 0, -1))})
+    assert result.name == 'sorted(data)' and result.loops >= 1 and result.mean > 0
+    assert [result.name for result in Bench.run_suite('obj_dict')] == ['obj_dict["x"]  # through ObjectAsDict']
+    assert [result.name for result in Bench.run_suite('Micros.r0')] == ['Micros.r0(1)  # a partial of fd 0, here /dev/zero']
+
+def test_bench_command_takes_the_rest_of_the_line():
+    from xpy.XPY import XPY
+    assert XPY._run_command_substitutions(':bench [x for x in  range(3)]\n') == "xpy.bench('[x for x in  range(3)]')"
+    assert XPY._run_command_substitutions(':bench') == "xpy.bench('')"
+    # quotes and a trailing backslash survive
+    expr = 's == \'"""\'\\'
+    expansion = XPY._run_command_substitutions(':bench ' + expr)
+    assert expansion.startswith('xpy.bench(') and eval(expansion[len('xpy.bench('): -1]) == expr
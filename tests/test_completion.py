@@ -0,0 +1,152 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import os
+import rlcompleter
+
+import pytest
+
+readline = pytest.importorskip('readline')
+
+from xpy.XPY import XPY
+
+@pytest.fixture(autouse = True)
+def module_index(monkeypatch, tmpdir):
+    # each test builds its own module index, cached in tmpdir
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
+    monkeypatch.setattr(XPY, 'module_index', None)
+    yield
+    if XPY.module_index is not None:
+        XPY.module_index.thread.join()
+
+class Execution(object):
+    def __init__(self, g, l = None):
+        self.g = g
+        self.l = l if l is not None else g
+
+def complete_all(fn, text):
+    matches = []
+    while True:
+        match = fn(text, len(matches))
+        if match is None:
+            return matches
+        matches.append(match)
+
+def test_matches_are_found_once_per_cycle(monkeypatch):
+    execution = Execution(dict(('name_%d' % i, i) for i in range(300)), {'name_local': len})
+    XPY().setup_tab_completion(execution)
+    fn = readline.get_completer()
+    calls = []
+    complete = rlcompleter.Completer.complete
+    monkeypatch.setattr(rlcompleter.Completer, 'complete', lambda *args: calls.append(args[1:]) or complete(*args))
+    matches = complete_all(fn, 'name_1')
+    assert sorted(matches) == sorted('name_%d' % i for i in range(300) if str(i).startswith('1'))
+    assert calls == [('name_1', 0)]
+    assert complete_all(fn, 'name_l') == ['name_local']
+    assert complete_all(fn, 'nomatch') == []
+
+def test_name_index_follows_namespace_changes(monkeypatch):
+    from xpy.NameIndex import NameIndex
+    g = {'alpha': 1, 'beta': 2}
+    l = {'alpha': 3, 'gamma': 4}
+    index = NameIndex([g, l, g])
+    assert index.matches('') == ['alpha', 'beta', 'gamma']
+    g['alpine'] = 5
+    del l['alpha']
+    del l['gamma']
+    assert index.update() == (['alpine'], ['gamma'])
+    assert index.matches('al') == ['alpha', 'alpine'] and index.matches('g') == []
+    #
+    # a new name bound before an old one is deleted and rebound
+    #
+    g['early'] = 6
+    del g['beta']
+    g['beta'] = 7
+    del g['alpha']
+    index.update()
+    assert index.names == ['alpine', 'beta', 'early']
+    monkeypatch.setattr(NameIndex, 'max_inserts', 2)
+    g.update(('n%d' % i, i) for i in range(10))
+    index.update()
+    assert index.names == sorted(set(g) | set(l))
+
+def test_completion_uses_the_name_index():
+    xpy = XPY()
+    execution = Execution({'name_a': 1})
+    xpy.setup_tab_completion(execution)
+    fn = readline.get_completer()
+    execution.g['name_b'] = 2
+    assert complete_all(fn, 'name_') == ['name_a']
+    xpy.name_index.update()
+    assert complete_all(fn, 'name_') == ['name_a', 'name_b']
+    assert complete_all(fn, 'pri') == ['print']
+
+def test_attribute_completion_runs_no_user_code():
+    from xpy.StaticAttrs import StaticAttrs
+    calls = []
+    class Remote(object):
+        __slots__ = ('handle',)
+        def __getattr__(self, name):
+            calls.append(name)
+            return 1
+        def __dir__(self):
+            calls.append('__dir__')
+            return []
+        @property
+        def slow(self):
+            calls.append('slow')
+            return self
+    class Holder(object):
+        pass
+    holder = Holder()
+    holder.remote = Remote()
+    holder.remote.handle = holder
+    namespace = {'holder': holder}
+    assert StaticAttrs.complete('holder.remote.s', [namespace]) == ['holder.remote.slow']
+    assert StaticAttrs.complete('holder.remote.handle.re', [namespace]) == ['holder.remote.handle.remote']
+    assert StaticAttrs.complete('holder.remote.slow.', [namespace]) == []
+    assert StaticAttrs.complete('holder.remote.other.', [namespace]) == []
+    assert 'holder.remote.__getattr__' in StaticAttrs.complete('holder.remote.__ge', [namespace])
+    assert calls == []
+    #
+    # cached class names are re-read once the class changes
+    #
+    Remote.speedy = 1
+    assert StaticAttrs.complete('holder.remote.s', [namespace]) == ['holder.remote.slow', 'holder.remote.speedy']
+    xpy = XPY()
+    xpy.setup_tab_completion(Execution(namespace))
+    assert complete_all(readline.get_completer(), 'holder.remote.sp') == ['holder.remote.speedy']
+    assert complete_all(readline.get_completer(), 'len.__na') == ['len.__name__']
+    assert calls == []
+
+def test_module_index_completes_imports_from_its_cache(tmpdir, monkeypatch):
+    from xpy.ModuleIndex import ModuleIndex
+    root = tmpdir.mkdir('site')
+    root.join('zzmod_one.py').write('')
+    package = root.mkdir('zzpkg')
+    package.join('__init__.py').write('raise ImportError')
+    package.join('zzsub.py').write('')
+    monkeypatch.setattr('sys.path', [str(root)])
+    cache_path = str(tmpdir.join('cache', 'modules.json'))
+    index = ModuleIndex(cache_path)
+    assert index.complete('import zz', 'zz') == []
+    index.start_refresh()
+    index.thread.join()
+    assert index.complete('import zz', 'zz') == ['zzmod_one', 'zzpkg']
+    assert index.complete('import os, zzpkg.z', 'zzpkg.z') == ['zzpkg.zzsub']
+    assert index.complete('from zzpkg import (zzsub as s, z', 'z') == ['zzsub']
+    assert index.complete('zz = 1', '1') is None
+    #
+    # a new console starts from the cache, and refreshes what's changed
+    #
+    root.join('zzmod_two.py').write('')
+    package.join('zzsub2.py').write('')
+    os.utime(str(root), (0, 0))
+    os.utime(str(package), (0, 0))
+    index = ModuleIndex(cache_path)
+    assert index.complete('from zz', 'zz') == ['zzmod_one', 'zzpkg']
+    assert index.refresh() is True
+    assert index.complete('from zz', 'zz') == ['zzmod_one', 'zzmod_two', 'zzpkg']
+    assert index.complete('from zzpkg.', 'zzpkg.') == ['zzpkg.zzsub', 'zzpkg.zzsub2']
+    assert index.refresh() is False
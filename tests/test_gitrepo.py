@@ -0,0 +1,68 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import subprocess
+
+import pytest
+
+from xpy.GitRepo import GitRepo
+
+@pytest.fixture
+def bare(monkeypatch, tmpdir):
+    for who in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv('GIT_' + who + '_NAME', 'xpy')
+        monkeypatch.setenv('GIT_' + who + '_EMAIL', 'xpy@localhost')
+    path = str(tmpdir.join('repo.git'))
+    subprocess.check_call(['git', 'init', '-q', '--bare', path])
+    return path
+
+def git(path, *args):
+    return subprocess.check_output(['git', '--git-dir', path] + list(args)).decode()
+
+def commit_file(repo, path, data, message = 'wip'):
+    head = repo.read_ref('refs/heads/master')
+    blob = repo.write_object(b'blob', data)
+    tree = repo.update_tree(repo.read_commit(head)['tree'] if head else None, {path: blob})
+    commit = repo.write_commit(tree, [head] if head else [], message)
+    assert repo.update_ref('refs/heads/master', commit, head)
+    return commit
+
+def test_commits_are_valid_git(bare):
+    repo = GitRepo(bare)
+    first = commit_file(repo, '.pyhistory', b'a = 1\n')
+    second = commit_file(repo, 'journal/one', b'b = 2\n')
+    git(bare, 'fsck', '--strict', '--no-dangling')
+    assert git(bare, 'show', 'master:.pyhistory') == 'a = 1\n'
+    assert git(bare, 'show', 'master:journal/one') == 'b = 2\n'
+    assert git(bare, 'rev-parse', 'master^').strip() == first
+    assert repo.read_path(second, 'journal/one') == b'b = 2\n'
+    assert repo.read_path(second, 'journal/two') is None
+
+def test_update_ref_is_compare_and_swap(bare):
+    repo = GitRepo(bare)
+    first = commit_file(repo, '.pyhistory', b'a = 1\n')
+    tree = repo.read_commit(first)['tree']
+    stale = repo.write_commit(tree, [], 'stale')
+    assert not repo.update_ref('refs/heads/master', stale, None)
+    assert repo.read_ref('refs/heads/master') == first
+
+def test_reads_packed_objects_and_refs(bare):
+    repo = GitRepo(bare)
+    versions = []
+    data = b''
+    for i in range(20):
+        data += ('line = %d\n' % i).encode() * 20
+        versions.append((commit_file(repo, '.pyhistory', data), data))
+    #
+    # pack everything with deltas and pack the refs
+    #
+    git(bare, 'repack', '-q', '-a', '-d', '-f', '--window=20')
+    git(bare, 'pack-refs', '--all')
+    git(bare, 'prune')
+    repo = GitRepo(bare)
+    assert repo.read_ref('refs/heads/master') == versions[-1][0]
+    for (commit, data) in versions:
+        assert repo.read_path(commit, '.pyhistory') == data
+    commit_file(repo, '.pyhistory', data + b'last\n')
+    git(bare, 'fsck', '--strict', '--no-dangling')
@@ -0,0 +1,390 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import os
+import time
+import threading
+import subprocess
+
+import readline
+
+import pytest
+
+from xpy.GitRepo import GitRepo
+from xpy.FileLock import FileLock
+from xpy.RepoHistory import RepoHistory
+from xpy.HistoryJournal import HistoryJournal
+
+@pytest.fixture
+def git_env(monkeypatch, tmpdir):
+    for who in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv('GIT_' + who + '_NAME', 'xpy')
+        monkeypatch.setenv('GIT_' + who + '_EMAIL', 'xpy@localhost')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('cache')))
+    readline.clear_history()
+    yield
+    readline.clear_history()
+
+def history_items():
+    return [readline.get_history_item(i) for i in range(1, readline.get_current_history_length() + 1)]
+
+def session(repo_url, lines, shard_key = None):
+    hist = RepoHistory(repo_url, shard_key)
+    hist.clone()
+    hist.wait()
+    for line in lines:
+        readline.add_history(line)
+    hist.commit()
+    readline.clear_history()
+
+def test_splice_keeps_typed_lines(git_env, tmpdir):
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['a = 1', 'b = 2'])
+    #
+    # lines typed before the clone finishes come after the cloned history
+    #
+    hist = RepoHistory(repo_url)
+    readline.add_history('typed early')
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['a = 1', 'b = 2', 'typed early']
+
+def test_overlapping_sessions_share_clone(git_env, tmpdir):
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['a = 1'])
+    #
+    # a second console opens and closes while the first is still running;
+    # each only commits its own lines
+    #
+    first = RepoHistory(repo_url)
+    first.clone()
+    first.wait()
+    readline.add_history('b = 2')
+    typed = history_items()
+    readline.clear_history()
+    session(repo_url, ['c = 3'])
+    for line in typed:
+        readline.add_history(line)
+    first.commit()
+    readline.clear_history()
+    hist = RepoHistory(repo_url)
+    assert hist.clone_path == first.clone_path
+    hist.clone()
+    hist.wait()
+    #
+    # journal segments are ordered by session start
+    #
+    assert history_items() == ['a = 1', 'b = 2', 'c = 3']
+
+def test_killed_session_lines_are_kept(git_env, tmpdir):
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['a = 1'])
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    readline.add_history('b = 2')
+    hist.poll()
+    #
+    # killed before commit, which releases the segment lock
+    #
+    hist.journal.close()
+    readline.clear_history()
+    session(repo_url, ['c = 3'])
+    repo = GitRepo(repo_url)
+    head = repo.read_ref('refs/heads/master')
+    journal = repo.read_tree(repo.find(head, 'journal')[1])
+    data = b''.join(repo.read_object(sha)[1] for (name, (mode, sha)) in sorted(journal.items()))
+    assert [line for (t, line) in HistoryJournal.parse(data)] == ['a = 1', 'b = 2', 'c = 3']
+    assert not hist.journal.segments()
+
+def test_remote_commit_of_committed_segment(git_env, tmpdir):
+    path = str(tmpdir.join('pyhist.git'))
+    subprocess.check_call(['git', 'init', '-q', '--bare', path])
+    repo_url = 'file://' + path
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    readline.add_history('a = 1')
+    hist.journal_history()
+    (name, data) = (hist.journal.name, hist.journal.read_segment(hist.journal.name))
+    hist.commit()
+    assert not hist.git_errors and not hist.journal.segments()
+    #
+    # a worker killed after committing, before removing the segment
+    #
+    with open(os.path.join(hist.journal.path, name), 'wb') as outfile:
+        outfile.write(data)
+    assert hist.flush()
+    assert not hist.git_errors and not hist.journal.segments()
+
+def test_compaction_folds_journal(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'compact_segments', 3)
+    repo_url = str(tmpdir.join('pyhist'))
+    for i in range(4):
+        session(repo_url, ['x = %d' % i])
+    repo = GitRepo(repo_url)
+    head = repo.read_ref('refs/heads/master')
+    assert len(repo.read_tree(repo.find(head, 'journal')[1])) == 1
+    base = repo.read_path(head, '.pyhistory')
+    assert [line for (t, line) in HistoryJournal.parse(base)] == ['x = 0', 'x = 1', 'x = 2']
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['x = 0', 'x = 1', 'x = 2', 'x = 3']
+
+def test_search_follows_compaction(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'compact_segments', 3)
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['import numpy as np', 'x = np.zeros(3)'])
+    session(repo_url, ['Y = NP.ones(3)', 'print(x)'])
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    readline.clear_history()
+    assert [line for (line, t, count) in hist.search('np.')] == ['Y = NP.ones(3)', 'x = np.zeros(3)']
+    #
+    # folding the journal into .pyhistory reindexes, and deduplicates
+    #
+    session(repo_url, ['x = np.zeros(3)'])
+    session(repo_url, ['z = 1'])
+    matches = hist.search('zeros')
+    assert [(line, count) for (line, t, count) in matches] == [('x = np.zeros(3)', 1)]
+    assert hist.search('np') and hist.search('import')[0][0] == 'import numpy as np'
+    hist.index.close()
+
+def test_search_reads_only_changed_sources(git_env, tmpdir, monkeypatch):
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['x = 1'])
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    assert [line for (line, t, count) in hist.search('x =')] == ['x = 1']
+    reads = []
+    read_file = RepoHistory.read_file
+    monkeypatch.setattr(RepoHistory, 'read_file', staticmethod(lambda path: reads.append(path) or read_file(path)))
+    assert [line for (line, t, count) in hist.search('x =')] == ['x = 1']
+    assert reads == []
+    hist.index.close()
+
+def test_hsearch_command_takes_the_rest_of_the_line():
+    from xpy.XPY import XPY
+    assert XPY._run_command_substitutions(':hsearch np.zeros(3) + 1') == "xpy.hsearch('np.zeros(3) + 1')"
+    assert XPY._run_command_substitutions(':hsearch s = "\\\\"') == "xpy.hsearch('s = \"\\\\\\\\\"')"
+
+def test_retention_is_deterministic():
+    entries = [
+        (100, 'x = 1'),
+        (100, 'def f():'),
+        (100, '    pass'),
+        (200, 'old = 1'),
+        (900, 'x = 1'),
+        (950, 'def g():'),
+        (950, '    pass'),
+        (1000, 'y = 2'),
+    ]
+    #
+    # the last use of a statement wins, continuation lines stay with theirs
+    #
+    assert HistoryJournal.retain(entries) == entries[1:]
+    assert HistoryJournal.retain(entries, max_age = 500) == entries[4:]
+    assert HistoryJournal.retain(entries, max_entries = 3) == entries[5:]
+    #
+    # the order sessions' segments are merged in doesn't matter
+    #
+    assert HistoryJournal.retain(entries[4:] + entries[:4]) == HistoryJournal.retain(entries)
+    #
+    # nor do sessions' statements entered in the same second, whose order
+    # within a session is kept
+    #
+    a = [('0001.a.1', b'#500\ny = 1\n#500\ndef f():\n#500\n    pass\n#600\nz = 1\n')]
+    b = [('0002.b.2', b'#500\nx = 1\n#500\ny = 1\n#600\nw = 1\n'), ('', b'old = 1\n')]
+    for kwargs in ({}, {'is_dedup': False}, {'max_entries': 3}):
+        assert HistoryJournal.retain(HistoryJournal.merge(a + b), **kwargs) == HistoryJournal.retain(HistoryJournal.merge(b + a), **kwargs)
+    assert [line for (t, line) in HistoryJournal.retain(HistoryJournal.merge(b + a))] == ['old = 1', 'def f():', '    pass', 'x = 1', 'y = 1', 'z = 1', 'w = 1']
+    data = HistoryJournal.format(HistoryJournal.retain(entries))
+    assert HistoryJournal.parse(data) == HistoryJournal.retain(entries)
+
+def test_detached_commit(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'is_detached_commit', True)
+    repo_url = str(tmpdir.join('pyhist'))
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    #
+    # the worker waits for the clone lock to be released
+    #
+    lock = FileLock(hist.lock_path)
+    lock.acquire()
+    readline.add_history('a = 1')
+    hist.commit()
+    time.sleep(0.5)
+    repo = GitRepo(repo_url)
+    assert repo.read_ref('refs/heads/master') is None
+    lock.release()
+    for i in range(100):
+        if os.path.exists(hist.log_path):
+            with open(hist.log_path) as infile:
+                if 'committed' in infile.read():
+                    break
+        time.sleep(0.1)
+    assert not hist.journal.segments()
+    head = repo.read_ref('refs/heads/master')
+    journal = repo.read_tree(repo.find(head, 'journal')[1])
+    data = b''.join(repo.read_object(sha)[1] for (mode, sha) in journal.values())
+    assert [line for (t, line) in HistoryJournal.parse(data)] == ['a = 1']
+
+def test_one_flush_commits_all_sessions(git_env, tmpdir):
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['a = 1'])
+    sessions = [RepoHistory(repo_url) for i in range(3)]
+    for hist in sessions:
+        hist.clone()
+        hist.wait()
+    #
+    # sessions exiting while another one flushes leave their segments to it
+    #
+    lock = FileLock(sessions[0].flush_lock_path)
+    lock.acquire()
+    readline.clear_history()
+    for (i, hist) in enumerate(sessions):
+        hist.journal.append(['x = %d' % i])
+        hist.commit()
+    lock.release()
+    assert len(sessions[0].journal.closed_segments()) == 3
+    sessions[0].flush()
+    assert not sessions[0].journal.segments()
+    repo = GitRepo(repo_url)
+    head = repo.read_ref('refs/heads/master')
+    parents = repo.read_commit(head)['parents']
+    assert len(repo.read_tree(repo.find(parents[0], 'journal')[1])) == 1
+    assert len(repo.read_tree(repo.find(head, 'journal')[1])) == 4
+
+def test_windowed_loading(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'load_window', 3)
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['x = %d' % i for i in range(10)])
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['x = 7', 'x = 8', 'x = 9']
+    readline.add_history('y = 1')
+    #
+    # older lines come from the store without being loaded
+    #
+    assert hist.get_last(5) == ['x = 6', 'x = 7', 'x = 8', 'x = 9', 'y = 1']
+    assert hist.page_in(2) == 2
+    assert history_items() == ['x = 5', 'x = 6', 'x = 7', 'x = 8', 'x = 9', 'y = 1']
+    assert hist.page_in(100) == 5
+    assert hist.page_in(100) == 0
+    hist.commit()
+    readline.clear_history()
+    session(repo_url, [])
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['x = 8', 'x = 9', 'y = 1']
+
+def test_startup_loads_only_the_cached_window(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'load_window', 3)
+    repo_url = str(tmpdir.join('pyhist'))
+    session(repo_url, ['x = %d' % i for i in range(10)])
+    session(repo_url, ['y = 1'])
+    #
+    # the whole history is only read on the clone thread
+    #
+    is_loading = threading.Event()
+    read_entries = RepoHistory.read_entries
+    def blocked_read_entries(self):
+        is_loading.wait()
+        return read_entries(self)
+    monkeypatch.setattr(RepoHistory, 'read_entries', blocked_read_entries)
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    # as the last session loaded it
+    assert history_items() == ['x = 7', 'x = 8', 'x = 9']
+    readline.add_history('z = 1')
+    is_loading.set()
+    hist.wait()
+    assert history_items() == ['x = 8', 'x = 9', 'y = 1', 'z = 1']
+    assert hist.page_in(1) == 1 and history_items()[0] == 'x = 7'
+
+def test_shards(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'shard_by', 'toplevel')
+    monkeypatch.setattr(RepoHistory, 'compact_segments', 2)
+    repo_url = str(tmpdir.join('pyhist'))
+    projects = []
+    for name in ('one', 'two'):
+        path = str(tmpdir.join(name))
+        os.makedirs(os.path.join(path, '.git'))
+        os.makedirs(os.path.join(path, 'src'))
+        projects.append(path)
+    session(repo_url, ['g = 0'])
+    for i in range(3):
+        for path in projects:
+            monkeypatch.chdir(os.path.join(path, 'src'))
+            session(repo_url, ['%s = %d' % (os.path.basename(path), i)], RepoHistory.get_shard_key())
+    #
+    # a console only loads its project's shard, compacted on its own
+    #
+    monkeypatch.chdir(projects[1])
+    hist = RepoHistory(repo_url, RepoHistory.get_shard_key())
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['two = 0', 'two = 1', 'two = 2']
+    repo = GitRepo(repo_url)
+    head = repo.read_ref('refs/heads/master')
+    assert repo.read_path(head, hist.history_path)
+    assert repo.read_path(head, '.pyhistory') is None
+    #
+    # search covers every shard
+    #
+    assert sorted(line for (line, t, count) in hist.search(' = 2')) == ['one = 2', 'two = 2']
+    assert [line for (line, t, count) in hist.search('g = ')] == ['g = 0']
+    hist.index.close()
+
+def test_every_shard_merges_by_union(git_env, tmpdir):
+    repo_url = str(tmpdir.join('pyhist'))
+    # the clone is made by a sharded console
+    session(repo_url, ['x = 1'], '/some/project')
+    hist = RepoHistory(repo_url)
+    paths = ['.pyhistory', 'shards/other-12345678/.pyhistory']
+    out = subprocess.check_output(['git', 'check-attr', 'merge', '--'] + paths, cwd = hist.clone_path).decode()
+    assert out.split('\n')[:2] == [path + ': merge: union' for path in paths]
+
+def test_maintenance_squashes_and_repacks(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'repack_loose_objects', 10)
+    monkeypatch.setattr(RepoHistory, 'squash_commits', 3)
+    repo_url = str(tmpdir.join('pyhist'))
+    for i in range(8):
+        session(repo_url, ['x = %d' % i])
+    repo = GitRepo(repo_url)
+    head = repo.read_ref('refs/heads/master')
+    assert repo.count_commits(head, 100) <= 4
+    assert repo.count_loose_objects() < 10
+    assert os.listdir(os.path.join(repo_url, 'objects', 'pack'))
+    #
+    # the clone follows the squashed branch
+    #
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['x = %d' % i for i in range(8)]
+
+def test_clone_follows_squash_without_repeating(git_env, tmpdir, monkeypatch):
+    monkeypatch.setattr(RepoHistory, 'repack_loose_objects', 10)
+    monkeypatch.setattr(RepoHistory, 'squash_commits', 3)
+    monkeypatch.setattr(RepoHistory, 'is_dedup', False)
+    repo_url = str(tmpdir.join('pyhist'))
+    for i in range(8):
+        session(repo_url, ['x = %d' % (10 + i % 2)])
+    hist = RepoHistory(repo_url)
+    hist.clone()
+    hist.wait()
+    assert history_items() == ['x = %d' % (10 + i % 2) for i in range(8)]
+    #
+    # the clone drops its commits from before the squash
+    #
+    head = GitRepo(repo_url).read_ref('refs/heads/master')
+    count = subprocess.check_output(['git', 'rev-list', '--count', '--all'], cwd = hist.clone_path)
+    assert int(count) == GitRepo(repo_url).count_commits(head, 100)
@@ -0,0 +1,47 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import os
+import threading
+
+from xpy.Output import Output
+
+def recurse(depth):
+    if depth:
+        return recurse(depth - 1)
+    raise ValueError('bottom')
+
+def test_traceback_is_one_write(monkeypatch):
+    from xpy.XPY import XPY
+    ring = Output.RingTarget()
+    monkeypatch.setattr(XPY, 'output', Output(ring))
+    try:
+        recurse(50)
+    except ValueError as e:
+        XPY.print_traceback()
+        XPY.print_exception(e)
+    assert len(ring.writes) == 2
+    assert ring.writes[0].count(b'return recurse(depth - 1)') == 50
+    assert b'ValueError' in ring.writes[1]
+    XPY.output.is_batching = False
+    XPY.hello('a\n')
+    with XPY.output.buffered():
+        XPY.hello('b\n')
+    assert list(ring.writes)[2:] == [b'a\n', b'b\n']
+
+def test_fd_target_finishes_partial_writes():
+    (read_fd, write_fd) = os.pipe()
+    parts = [b'%d,' % i for i in range(5000)] + [b'x' * 200000]
+    received = []
+    reader = threading.Thread(target = lambda: received.extend(iter(lambda: os.read(read_fd, 1 << 16), b'')))
+    reader.start()
+    output = Output(Output.FdTarget(write_fd))
+    with output.buffered():
+        for part in parts:
+            output.write(part)
+        assert not received
+    os.close(write_fd)
+    reader.join()
+    os.close(read_fd)
+    assert b''.join(received) == b''.join(parts)
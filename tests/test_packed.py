@@ -0,0 +1,35 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import pytest
+
+from xpy.PackedArray import PackedArray
+from xpy.HistoryStore import HistoryStore
+
+@pytest.fixture(params = [True, False], ids = ['cast', 'struct'])
+def is_cast(request, monkeypatch):
+    # struct is what python 2 gets
+    monkeypatch.setattr(PackedArray, 'is_cast', request.param)
+    return request.param
+
+def test_view(is_cast):
+    data = b'head' + PackedArray.pack('Q', [0, 5, 2 ** 40]) + b'text'
+    values = PackedArray.view(data, 4, 'Q', 3)
+    assert len(values) == 3 and list(values) == [0, 5, 2 ** 40] and values[-1] == 2 ** 40
+    assert bytes(PackedArray.view_bytes(data, 28, 4)[1:3]) == b'ex'
+    assert PackedArray.unpack('I', PackedArray.pack('I', [7, 8])) == [7, 8]
+
+def test_store(is_cast, tmpdir):
+    store = HistoryStore(str(tmpdir.join('store')))
+    store.write([u'x = 1', u'', u'print("\u00e9")'])
+    assert len(store) == 3 and store[1:] == [u'', u'print("\u00e9")']
+    store.close()
+
+def test_index(is_cast, tmpdir):
+    from xpy.HistoryIndex import HistoryIndex
+    index = HistoryIndex(str(tmpdir))
+    index.add([('a', [(100, u'import numpy as np'), (200, u'x = np.zeros(3)')]), ('b', [(300, u'y = 1')])])
+    assert index.search('NP.') == [(u'x = np.zeros(3)', 200, 1)]
+    assert index.read_lines(index.manifest['segments'][0]['file'])[2] == (300, u'y = 1')
+    index.close()
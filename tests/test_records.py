@@ -0,0 +1,58 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import sys
+
+import pytest
+
+from xpy.HistoryRecords import HistoryRecords
+
+@pytest.fixture(params = ['numpy', 'array'])
+def records(request, monkeypatch, tmpdir):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setitem(sys.modules, 'numpy', None)
+    return HistoryRecords(str(tmpdir.join('records')))
+
+def test_queries(records):
+    records.append(100.0, 0.5, True, 'xpy.Main', '/tmp', 'x = 1')
+    records.append(200.0, 3.0, False, 'mod', '/tmp', 'def f():\n    1 / 0\nf()')
+    records.append(300.0, 2.0, True, 'mod', '/home', 'y = 2')
+    records.append(400.0, 1.0, False, 'xpy.Main', '/tmp', 'z')
+    assert [r.source for r in records.slowest(2)] == ['def f():\n    1 / 0\nf()', 'y = 2']
+    assert [r.source for r in records.slowest(since = 250)] == ['y = 2', 'z']
+    assert [r.source for r in records.failures('mod')] == ['def f():\n    1 / 0\nf()']
+    assert records.failures('nowhere') == []
+    assert records.failures()[1] == HistoryRecords.Record(400.0, 1.0, False, 'xpy.Main', '/tmp', 'z')
+
+def test_partial_append_is_ignored(records):
+    records.append(100.0, 0.5, True, 'xpy.Main', '/tmp', 'x = 1')
+    #
+    # killed after writing only some columns
+    #
+    with open(records.column_path('t0'), 'ab') as outfile:
+        outfile.write(b'\0' * 8)
+    assert records.row_count() == 1
+    records.append(200.0, 0.5, True, 'xpy.Main', '/tmp', 'y = 2')
+    assert [r.t0 for r in records.read(range(records.row_count()))] == [100.0, 200.0]
+
+def test_hslow_count_is_optional():
+    from xpy.XPY import XPY
+    assert XPY._run_command_substitutions(':hslow') == "xpy.hslow('')"
+    assert XPY._run_command_substitutions(':hslow 5') == "xpy.hslow('5')"
+
+def test_record_errors_are_reported(tmpdir, monkeypatch):
+    from xpy.XPY import XPY
+    from xpy.Output import Output
+    class Execution(object):
+        g = l = {'__name__': '__main__'}
+        (t0, t1, result, source) = (100.0, 101.0, True, 'x = 1')
+    xpy = XPY()
+    monkeypatch.setattr(XPY, 'output', Output(Output.RingTarget()))
+    # a file where the records directory should be
+    tmpdir.join('records').write('')
+    xpy.history_records = HistoryRecords(str(tmpdir.join('records')))
+    xpy.record_execution(Execution())
+    assert b'statement not recorded' in XPY.output.target.getvalue()
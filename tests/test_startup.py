@@ -0,0 +1,74 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Cold start benchmark: time from spawning `python -m xpy` until the first
+# prompt is written, less the cost of starting a bare interpreter.
+#
+# The budget (in seconds) can be changed with XPY_STARTUP_BUDGET.
+#
+
+import os
+import sys
+import time
+import subprocess
+
+import pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+
+budget = float(os.environ.get('XPY_STARTUP_BUDGET', '0.25'))
+
+def console_env(home):
+    env = dict(os.environ)
+    env['HOME'] = home
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    env.pop('PYTHONSTARTUP', None)
+    for who in ('AUTHOR', 'COMMITTER'):
+        env['GIT_' + who + '_NAME'] = 'xpy'
+        env['GIT_' + who + '_EMAIL'] = 'xpy@localhost'
+    return env
+
+def time_to_prompt(env):
+    t0 = time.time()
+    proc = subprocess.Popen([sys.executable, '-m', 'xpy'], env = env,
+        stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+    try:
+        buf = b''
+        while b'!!!' not in buf:
+            c = proc.stdout.read(1)
+            if not c:
+                break
+            buf += c
+        t1 = time.time()
+        assert b'!!!' in buf, buf
+    finally:
+        proc.stdin.close()
+        proc.wait()
+    return t1 - t0
+
+def time_bare_interpreter(env):
+    t0 = time.time()
+    subprocess.check_call([sys.executable, '-c', 'pass'], env = env)
+    return time.time() - t0
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason = 'lazy package attributes need python 3.7')
+def test_import_is_lazy(tmpdir):
+    source = 'import sys, xpy; print(" ".join(sorted(sys.modules)))'
+    out = subprocess.check_output([sys.executable, '-c', source], env = console_env(str(tmpdir)))
+    modules = out.decode().split()
+    for name in ('greenlet', 'cytoolz', 'xpy.XPY', 'xpy.ConsoleImports', 'xpy.Clip', 'xpy.Micros'):
+        assert name not in modules
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason = 'lazy package attributes need python 3.7')
+def test_cold_start_budget(tmpdir):
+    env = console_env(str(tmpdir))
+    #
+    # first run creates ~/.pyhist; take the best of a few runs after that
+    #
+    time_to_prompt(env)
+    bare = min(time_bare_interpreter(env) for i in range(3))
+    cold = min(time_to_prompt(env) for i in range(3))
+    assert cold - bare < budget, 'startup took %0.3fs over a bare interpreter (budget %0.3fs)' % (cold - bare, budget)
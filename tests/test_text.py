@@ -0,0 +1,113 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import os
+import random
+import tempfile
+
+from xpy.Text import Text
+from xpy.File import File
+
+def chunks(data, sizes):
+    i = 0
+    for size in sizes:
+        if i >= len(data):
+            break
+        yield data[i: i + size]
+        i += size
+    if i < len(data):
+        yield data[i:]
+
+def test_chunk_splitter_matches_splitter3():
+    rand = random.Random(0)
+    for eol in (b'\n', b'\r\n', b'<eol>'):
+        for trial in range(50):
+            data = b''.join(rand.choice([b'a', b'bc', b'\r', b'<eo', eol, b'l>']) for i in range(rand.randint(0, 60)))
+            sizes = [rand.randint(1, 7) for i in range(len(data))]
+            expected = list(Text.splitter3([data], eol))
+            assert list(Text.chunk_splitter(chunks(data, sizes), eol)) == expected
+            assert list(Text.chunk_splitter([data], eol)) == expected
+
+def test_chunk_splitter_takes_memoryviews():
+    data = b'one\r\ntwo\r\nthree'
+    views = [memoryview(data)[i: i + 3] for i in range(0, len(data), 3)]
+    assert list(Text.chunk_splitter(views, b'\r\n')) == [b'one\r\n', b'two\r\n', b'three']
+
+def test_reader_maps_files_and_reuses_a_buffer_for_pipes():
+    data = b''.join(b'line %d\r\n' % i for i in range(1000))
+    (fd, path) = tempfile.mkstemp()
+    os.write(fd, data)
+    os.lseek(fd, 0, os.SEEK_SET)
+    try:
+        views = [bytes(view) for view in File.reader(fd, max_chunk = 1000)]
+        assert [len(view) for view in views[:-1]] == [1000] * (len(views) - 1)
+        assert b''.join(views) == data
+        os.lseek(fd, 0, os.SEEK_SET)
+        lines = [bytes(line) for line in Text.splitter(File.reader(fd, max_chunk = 7), b'\r\n')]
+        assert lines == [b'line %d\r\n' % i for i in range(1000)]
+    finally:
+        os.close(fd)
+        os.unlink(path)
+    (read_fd, write_fd) = os.pipe()
+    os.write(write_fd, data[:5000])
+    os.close(write_fd)
+    sizes = [len(view) for view in File.reader(read_fd, chunk = 16, max_chunk = 256)]
+    os.close(read_fd)
+    #
+    # reads which fill the buffer double the read size
+    #
+    assert sizes[:5] == [16, 32, 64, 128, 256] and sum(sizes) == 5000
+
+def upper_if_odd(record):
+    return record.upper() if int(record.split()[1]) % 2 else None
+
+def test_file_scan_matches_splitter():
+    from xpy.FileScan import FileScan
+    rand = random.Random(0)
+    (fd, path) = tempfile.mkstemp()
+    try:
+        for eol in (b'\n', b'\r\n', b'\n\n'):
+            data = b''.join(b'r %d %s%s' % (i, b'x' * rand.randint(0, 30), eol) for i in range(2000)) + b'r 2001'
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, data, 0)
+            records = list(Text.splitter([data], eol))
+            assert list(FileScan.scan(path, eol, range_size = 1000)) == records
+            expected = [record.upper() for record in records if int(record.split()[1]) % 2]
+            assert list(FileScan.scan(path, eol, upper_if_odd, processes = 3, range_size = 1000)) == expected
+            assert sorted(FileScan.scan(path, eol, upper_if_odd, processes = 3, is_ordered = False, range_size = 5000)) == sorted(expected)
+            assert (len(FileScan.ranges(path, eol, 1000)) == 1) == (eol == b'\n\n')
+    finally:
+        os.close(fd)
+        os.unlink(path)
+
+def test_frames_across_chunk_boundaries():
+    import struct
+    from xpy.Frames import Frames
+    rand = random.Random(0)
+    payloads = [bytes(rand.randint(0, 255) for j in range(rand.choice([0, 1, 5, 127, 128, 300]))) for i in range(200)]
+    for (header, pack) in (('varint', Frames.varint), ('>H', struct.Struct('>H').pack)):
+        data = b''.join(pack(len(payload)) + payload for payload in payloads)
+        for sizes in ([len(data)], [1] * len(data), [rand.randint(1, 400) for i in range(len(data))]):
+            assert [bytes(frame) for frame in Frames.length_prefixed(chunks(data, sizes), header)] == payloads
+    data = bytes(range(256)) * 4
+    sizes = [rand.randint(1, 50) for i in range(len(data))]
+    assert [bytes(record) for record in Frames.fixed(chunks(data, sizes), 16)] == [data[i: i + 16] for i in range(0, len(data), 16)]
+    try:
+        list(Frames.fixed([data[:-1]], 16))
+    except ValueError as e:
+        pass
+    else:
+        assert False
+
+def test_frames_fixed_arrays():
+    np = __import__('pytest').importorskip('numpy')
+    from xpy.Frames import Frames
+    dtype = np.dtype([('t', '<f8'), ('n', '<u4')])
+    expected = np.zeros(1000, dtype = dtype)
+    expected['t'] = np.arange(1000) / 4.0
+    expected['n'] = np.arange(1000)
+    data = expected.tobytes()
+    batches = list(Frames.fixed_arrays(chunks(data, [1000, 7] * len(data)), dtype, batch = 50))
+    assert max(len(batch) for batch in batches) == 50
+    assert (np.concatenate(batches) == expected).all()
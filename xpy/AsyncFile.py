@@ -0,0 +1,98 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Asyncio counterparts of File.streamer and Text.chunk_splitter, as async
+# generators over asyncio.StreamReader, so many pipes, sockets and
+# subprocess outputs can be read from one thread.
+#
+# Backpressure comes from the stream: a StreamReader stops reading from its
+# transport once its buffer passes its limit, until the generator is
+# resumed.  merge keeps that by handing lines over through a bounded queue.
+#
+# Needs Python 3.6 for async generators, so it's kept apart from File.
+#
+#   async for (i, line) in AsyncFile.merge([AsyncFile.open_pipe(f) for f in pipes], b'\n'):
+#       ...
+#
+
+import os
+import asyncio
+
+from .Text import LineSplitter
+
+class AsyncFile(object):
+    @classmethod
+    async def open_pipe(self, pipe, limit = 1 << 16):
+        """A StreamReader for a pipe, given as a file object or a descriptor, which it then owns."""
+        loop = asyncio.get_event_loop()
+        if isinstance(pipe, int):
+            pipe = os.fdopen(pipe, 'rb', 0)
+        reader = asyncio.StreamReader(limit = limit)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        return reader
+
+    @classmethod
+    async def streamer(self, reader, chunk = 1 << 16):
+        """Yield chunks read from reader until EOF, like File.streamer."""
+        if not isinstance(reader, asyncio.StreamReader):
+            reader = await reader
+        while True:
+            buf = await reader.read(chunk)
+            if buf:
+                yield buf
+            else:
+                break
+
+    @classmethod
+    async def splitter(self, bufs, eol):
+        """Split an async iterable of byte chunks into lines, like Text.chunk_splitter."""
+        splitter = LineSplitter(eol)
+        async for buf in bufs:
+            for line in splitter.feed(buf):
+                yield line
+        for line in splitter.finish():
+            yield line
+
+    @classmethod
+    async def lines(self, reader, eol = b'\n', chunk = 1 << 16):
+        """Yield lines read from reader, or an awaitable of one, such as open_pipe."""
+        async for line in self.splitter(self.streamer(reader, chunk), eol):
+            yield line
+
+    @classmethod
+    async def merge(self, readers, eol = b'\n', maxsize = 1024):
+        """
+        Yield (i, line) for lines from each of readers as they arrive.
+
+        Each reader is read by its own task into a queue of at most maxsize
+        lines, so a slow consumer holds up the readers rather than
+        buffering without bound.  A reader's error is raised once the others
+        are done.
+        """
+        queue = asyncio.Queue()
+        # bounds the lines queued; the marker for a finished reader never waits
+        slots = asyncio.Semaphore(maxsize)
+        done = object()
+        async def pump(i, reader):
+            try:
+                async for line in self.lines(reader, eol):
+                    await slots.acquire()
+                    queue.put_nowait((i, line))
+            finally:
+                queue.put_nowait((i, done))
+        tasks = [asyncio.ensure_future(pump(i, reader)) for (i, reader) in enumerate(readers)]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                (i, line) = await queue.get()
+                if line is done:
+                    remaining -= 1
+                else:
+                    slots.release()
+                    yield (i, line)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,165 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Micro-benchmarks, as ns/op with a confidence interval.
+#
+# A statement is timed with timeit: the loop count is doubled until a run
+# takes at least min_time, one run is discarded as warmup, then samples
+# runs are timed.  The cost of an empty loop of the same count is
+# subtracted, samples more than outlier_mads median absolute deviations
+# from the median are rejected, and the interval is the mean of the rest
+# plus or minus a Student t multiple of its standard error.
+#
+#   Bench.show(Bench.run('os.getpid()', globals = {'os': os}))
+#   python -m xpy.Bench
+#
+
+import os
+import sys
+import math
+import timeit
+import collections
+
+class Bench(object):
+    min_time = 0.01
+    samples = 15
+    outlier_mads = 5.0
+    Result = collections.namedtuple('Result', 'name loops mean low high kept rejected')
+    # two-sided 95% Student t quantiles by degrees of freedom, 1.96 beyond
+    t95 = (12.71, 4.30, 3.18, 2.78, 2.57, 2.45, 2.36, 2.31, 2.26, 2.23, 2.20, 2.18, 2.16, 2.14, 2.13, 2.12, 2.11, 2.10, 2.09, 2.09)
+
+    @classmethod
+    def calibrate(self, timer):
+        """A loop count which takes timer at least min_time."""
+        loops = 1
+        while timer.timeit(loops) < self.min_time:
+            loops *= 2
+        return loops
+
+    @classmethod
+    def summarize(self, name, loops, times):
+        """Result of per-op times in seconds, with outliers rejected."""
+        ordered = sorted(times)
+        median = ordered[len(ordered) // 2]
+        mad = sorted(abs(t - median) for t in times)[len(times) // 2]
+        kept = [t for t in times if abs(t - median) <= self.outlier_mads * mad] or [median]
+        mean = sum(kept) / len(kept)
+        if len(kept) > 1:
+            stdev = math.sqrt(sum((t - mean) ** 2 for t in kept) / (len(kept) - 1))
+            t = self.t95[len(kept) - 2] if len(kept) - 2 < len(self.t95) else 1.96
+            error = t * stdev / math.sqrt(len(kept))
+        else:
+            error = 0.0
+        ns = 1e9
+        return self.Result(name, loops, mean * ns, (mean - error) * ns, (mean + error) * ns, len(kept), len(times) - len(kept))
+
+    @classmethod
+    def run(self, stmt, setup = 'pass', globals = None, name = None):
+        """Time stmt, a string or callable, returning a Result in ns/op."""
+        timer = timeit.Timer(stmt, setup, globals = globals)
+        empty = timeit.Timer('pass', setup, globals = globals)
+        loops = self.calibrate(timer)
+        # warmup
+        timer.timeit(loops)
+        times = []
+        for i in range(self.samples):
+            elapsed = timer.timeit(loops) - empty.timeit(loops)
+            times.append(max(elapsed, 0.0) / loops)
+        return self.summarize(name or (stmt if isinstance(stmt, str) else getattr(stmt, '__name__', repr(stmt))), loops, times)
+
+    @classmethod
+    def format(self, result):
+        return '{:50} {:10.1f} ns/op  [{:.1f}, {:.1f}]  {} loops  {} rejected'.format(
+            result.name, result.mean, result.low, result.high, result.loops, result.rejected)
+
+    @classmethod
+    def show(self, results):
+        if isinstance(results, self.Result):
+            results = [results]
+        for result in results:
+            print(self.format(result))
+
+    #
+    # the project's own helpers
+    #
+    suite_setup = '\n'.join([
+        'import os',
+        'import functools',
+        'from xpy.Micros import Micros',
+        'from xpy.Anymethod import anymethod',
+        'from xpy.SuperMethod import SuperMethod',
+        'from xpy.ObjectAsDict import ObjectAsDict',
+        'null = os.open(os.devnull, os.O_WRONLY)',
+        'zero = os.open("/dev/zero", os.O_RDONLY)',
+        'r_zero = Micros.r(zero)',
+        'w_null = Micros.w(null)',
+        'p_zero = functools.partial(os.read, zero)',
+        'p_null = functools.partial(os.write, null)',
+        'class Base(object):',
+        '    x = 1',
+        '    def method(self): pass',
+        '    @classmethod',
+        '    def clsmethod(self): pass',
+        '    @anymethod',
+        '    def any(self): pass',
+        'class Super(Base):',
+        '    def method(self): super(Super, self).method()',
+        '    @SuperMethod',
+        '    def any(super, self): super.any()',
+        'obj = Super()',
+        'obj_dict = ObjectAsDict(obj)',
+    ])
+    suite = (
+        ('os.read(zero, 1)', 'read 1 byte from /dev/zero'),
+        ('Micros.r(zero, 1)', ''),
+        ('Micros.r(zero)(1)', ''),
+        ('r_zero(1)', 'curried once, called many times'),
+        ('p_zero(1)', 'functools.partial'),
+        ('Micros.r0(1)', 'a partial of fd 0, here /dev/zero'),
+        ('os.write(null, b"x")', 'write 1 byte to /dev/null'),
+        ('Micros.w(null, b"x")', ''),
+        ('w_null(b"x")', 'curried once, called many times'),
+        ('p_null(b"x")', 'functools.partial'),
+        ('Micros.w1(b"x")', 'a partial of fd 1, here /dev/null'),
+        ('obj.method()', 'call a method'),
+        ('obj.clsmethod()', ''),
+        ('obj.any()', 'an anymethod via a SuperMethod'),
+        ('Base.any()', 'an anymethod on the class'),
+        ('Super.method(obj)', 'super() chain'),
+        ('obj.x', 'read an attribute'),
+        ('getattr(obj, "x")', ''),
+        ('obj_dict["x"]', 'through ObjectAsDict'),
+    )
+
+    @classmethod
+    def run_suite(self, pattern = None):
+        """Results of the bundled suite, of statements containing pattern if given."""
+        # set up once, as timeit would run the setup, opening files, every call
+        namespace = {}
+        exec(self.suite_setup, namespace)
+        #
+        # Micros.r0 and w1 use fds 0 and 1, so point those at /dev/zero and
+        # /dev/null meanwhile
+        #
+        sys.stdout.flush()
+        saved = (os.dup(0), os.dup(1))
+        os.dup2(namespace['zero'], 0)
+        os.dup2(namespace['null'], 1)
+        try:
+            results = []
+            for (stmt, note) in self.suite:
+                if pattern is None or pattern in stmt:
+                    results.append(self.run(stmt, globals = namespace, name = stmt + ('  # ' + note if note else '')))
+            return results
+        finally:
+            for (fd, saved_fd) in enumerate(saved):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+            os.close(namespace['null'])
+            os.close(namespace['zero'])
+
+
+if __name__ == '__main__':
+    Bench.show(Bench.run_suite())
@@ -2,18 +2,25 @@
 # Copyright 2016-2018 David J. Beal, All Rights Reserved
 #
 
+from .LazyImport import LazyImport
+
 class ConsoleImports(object):
     """
     For convenience, names bound within this class will be linked to the
     globals of the interpreter.
-    """
-    from .Clip import Clip
-    # from .Plot import Plot
-    from .Colors import Colors
-    from .Micros import Micros as M
-    from .XPY import ResumEx, rese
-    from .Profiler import Profiler
-    from .Builtins import EA, FL, ls
-    from .Debug import Debug
-    from .History import History
 
+    Each name is imported on first access, so nothing here is loaded until
+    the console namespace is polluted or the name is looked up.
+    """
+    Clip = LazyImport('.Clip', 'Clip')
+    # Plot = LazyImport('.Plot', 'Plot')
+    Colors = LazyImport('.Colors', 'Colors')
+    M = LazyImport('.Micros', 'Micros')
+    ResumEx = LazyImport('.XPY', 'ResumEx')
+    rese = LazyImport('.XPY', 'rese')
+    Profiler = LazyImport('.Profiler', 'Profiler')
+    EA = LazyImport('.Builtins', 'EA')
+    FL = LazyImport('.Builtins', 'FL')
+    ls = LazyImport('.Builtins', 'ls')
+    Debug = LazyImport('.Debug', 'Debug')
+    History = LazyImport('.History', 'History')
@@ -4,6 +4,8 @@
 #
 
 import os
+import mmap
+import stat
 
 class File(object):
     @classmethod
@@ -15,3 +17,44 @@ class File(object):
             else:
                 break
 
+
+    @classmethod
+    def reader(self, fd, chunk = 1 << 16, max_chunk = 1 << 20):
+        """
+        Read fd to the end, yielding memoryviews rather than new bytes.
+
+        Regular files are memory-mapped and yielded in max_chunk windows.
+        Anything else is read with readv into one preallocated buffer, whose
+        read size starts at chunk and doubles up to max_chunk while reads
+        fill it.  A view is only valid until the next one is requested.
+        """
+        st = os.fstat(fd)
+        if stat.S_ISREG(st.st_mode) and st.st_size:
+            mm = mmap.mmap(fd, 0, access = mmap.ACCESS_READ)
+            view = memoryview(mm)
+            try:
+                for i in range(os.lseek(fd, 0, os.SEEK_CUR), len(mm), max_chunk):
+                    window = view[i: i + max_chunk]
+                    yield window
+                    window.release()
+                os.lseek(fd, 0, os.SEEK_END)
+            finally:
+                view.release()
+                try:
+                    mm.close()
+                except BufferError:
+                    # the caller still holds a view; it's unmapped once freed
+                    pass
+        elif hasattr(os, 'readv'):
+            buf = memoryview(bytearray(max_chunk))
+            size = min(chunk, max_chunk)
+            while True:
+                n = os.readv(fd, [buf[:size]])
+                if not n:
+                    break
+                yield buf[:n]
+                if n == size:
+                    size = min(2 * size, max_chunk)
+        else:
+            for buf in self.streamer(fd, chunk):
+                yield memoryview(buf)
@@ -0,0 +1,49 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import os
+import errno
+import fcntl
+
+class FileLock(object):
+    """
+    Exclusive flock(2) lock on a path, usable as a context manager.
+
+    with FileLock(path):
+        ...
+
+    The lock file is created on demand and never removed, so every holder
+    locks the same inode.  Locks belong to the open file, so separate
+    FileLock objects exclude each other even within one process.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking = True):
+        """Take the lock, returning False if non-blocking and already held."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except (IOError, OSError) as e:
+            os.close(fd)
+            if blocking or e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        fd = self.fd
+        self.fd = None
+        if fd is not None:
+            os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
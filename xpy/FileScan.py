@@ -0,0 +1,110 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Parallel scan of a large file's records, the parallel counterpart of
+# Text.splitter over File.streamer.
+#
+# The file is cut into byte ranges which end just after an eol, so each
+# record falls in exactly one range.  A process pool scans the ranges, each
+# worker mapping only its own slice, and runs func over every record there,
+# so only func's results come back across the process boundary.  func
+# returns None to drop a record, and must be picklable, i.e. defined at
+# module level.
+#
+#   for (t, line) in FileScan.scan('/var/log/big.log', b'\n', parse_if_error):
+#       ...
+#
+
+import os
+import re
+import mmap
+import multiprocessing
+
+class FileScan(object):
+    range_size = 64 << 20
+
+    @classmethod
+    def is_overlapping(self, eol):
+        """True if eol could overlap itself, e.g. b'\\n\\n', so a range boundary can't be found from an arbitrary offset."""
+        return any(eol[:k] == eol[-k:] for k in range(1, len(eol)))
+
+    @classmethod
+    def ranges(self, path, eol, range_size = None):
+        """(start, end) byte ranges of the file at path, each ending just after an eol or at the end."""
+        range_size = range_size or self.range_size
+        size = os.path.getsize(path)
+        if not size:
+            return []
+        if self.is_overlapping(eol):
+            return [(0, size)]
+        bounds = [0]
+        with open(path, 'rb') as infile:
+            mm = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+            try:
+                while bounds[-1] + range_size < size:
+                    #
+                    # occurrences of an eol which can't overlap itself are
+                    # the ones a sequential split finds, so any will do
+                    #
+                    i = mm.find(eol, bounds[-1] + range_size)
+                    if i < 0:
+                        break
+                    bounds.append(i + len(eol))
+            finally:
+                mm.close()
+        if bounds[-1] < size:
+            bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @classmethod
+    def scan_range(self, args):
+        """func's results for records in one range, scanned from a map of just that slice."""
+        (path, start, end, eol, func) = args
+        offset = start - start % mmap.ALLOCATIONGRANULARITY
+        results = []
+        with open(path, 'rb') as infile:
+            mm = mmap.mmap(infile.fileno(), end - offset, offset = offset, access = mmap.ACCESS_READ)
+            try:
+                at = start - offset
+                stop = end - offset
+                for match in re.compile(re.escape(eol)).finditer(mm, at, stop):
+                    record = mm[at: match.end()]
+                    at = match.end()
+                    result = func(record) if func is not None else record
+                    if result is not None:
+                        results.append(result)
+                if at < stop:
+                    # the final incomplete record
+                    result = func(mm[at: stop]) if func is not None else mm[at: stop]
+                    if result is not None:
+                        results.append(result)
+            finally:
+                mm.close()
+        return results
+
+    @classmethod
+    def scan(self, path, eol, func = None, processes = None, is_ordered = True, range_size = None):
+        """
+        Yield func(record), or the record if func is None, for each record in
+        the file at path, skipping None results.
+
+        Records are yielded in file order unless is_ordered is false, when
+        each range's results are yielded as soon as it's done.
+        """
+        tasks = [(path, start, end, eol, func) for (start, end) in self.ranges(path, eol, range_size)]
+        if processes == 1 or len(tasks) < 2:
+            for task in tasks:
+                for result in self.scan_range(task):
+                    yield result
+            return
+        pool = multiprocessing.Pool(processes)
+        try:
+            scanned = pool.imap(self.scan_range, tasks) if is_ordered else pool.imap_unordered(self.scan_range, tasks)
+            for results in scanned:
+                for result in results:
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
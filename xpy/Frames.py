@@ -0,0 +1,133 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Framing of binary records in a stream of byte chunks, e.g. from
+# File.streamer or File.reader, for records which aren't delimited.
+#
+# Records are yielded as memoryviews into the chunks, without copying; only
+# a record straddling two chunks is copied, into a buffer of its own.  A view
+# is valid as long as its chunk is, so with File.reader only until the next
+# record is requested.
+#
+#   for record in Frames.length_prefixed(File.streamer(fd, 1 << 16), '<I'):
+#       ...
+#
+
+import struct
+
+class Frames(object):
+    # a varint of a 64 bit length
+    varint_max = 10
+
+    @classmethod
+    def runs(self, bufs, size):
+        """Yield memoryviews of whole numbers of size byte records, the last chunk's straddling record joined to the next."""
+        pending = bytearray()
+        for buf in bufs:
+            view = memoryview(buf).cast('B')
+            at = 0
+            if pending:
+                at = min(size - len(pending), len(view))
+                pending += view[:at]
+                if len(pending) < size:
+                    continue
+                yield memoryview(pending)
+                pending = bytearray()
+            end = at + (len(view) - at) // size * size
+            if end > at:
+                yield view[at: end]
+            pending += view[end:]
+        if pending:
+            raise ValueError('stream ends within a record, %d of %d bytes' % (len(pending), size))
+
+    @classmethod
+    def fixed(self, bufs, size):
+        """Yield memoryviews of size byte records."""
+        for run in self.runs(bufs, size):
+            for i in range(0, len(run), size):
+                yield run[i: i + size]
+
+    @classmethod
+    def fixed_arrays(self, bufs, dtype, batch = 1 << 12):
+        """
+        Yield NumPy structured arrays of up to batch records of dtype, viewing
+        the chunks rather than copying them.
+        """
+        import numpy as np
+        dtype = np.dtype(dtype)
+        for run in self.runs(bufs, dtype.itemsize):
+            records = np.frombuffer(run, dtype = dtype)
+            for i in range(0, len(records), batch):
+                yield records[i: i + batch]
+
+    @classmethod
+    def parse_header(self, buf, at, header):
+        """(length, header size) of the frame at buf[at:], or None if the header's incomplete."""
+        if header is None:
+            size = shift = 0
+            for i in range(at, min(len(buf), at + self.varint_max)):
+                byte = buf[i]
+                size |= (byte & 0x7f) << shift
+                shift += 7
+                if byte < 0x80:
+                    return (size, i + 1 - at)
+            if len(buf) - at >= self.varint_max:
+                raise ValueError('varint longer than %d bytes at %d' % (self.varint_max, at))
+            return None
+        if len(buf) - at < header.size:
+            return None
+        return (header.unpack_from(buf, at)[0], header.size)
+
+    @classmethod
+    def length_prefixed(self, bufs, header = 'varint'):
+        """
+        Yield memoryviews of the payloads of frames each prefixed by its
+        length, as an unsigned LEB128 varint, or in a struct format such as
+        '>I'.
+        """
+        header = None if header == 'varint' else struct.Struct(header)
+        header_max = self.varint_max if header is None else header.size
+        pending = bytearray()
+        for buf in bufs:
+            view = memoryview(buf).cast('B')
+            at = 0
+            #
+            # finish a frame straddling the previous chunk; bytes taken past
+            # its end while reading its header are given back
+            #
+            while pending and at < len(view):
+                parsed = self.parse_header(pending, 0, header)
+                want = header_max if parsed is None else sum(parsed)
+                take = min(want - len(pending), len(view) - at)
+                pending += view[at: at + take]
+                at += take
+                parsed = self.parse_header(pending, 0, header)
+                if parsed is not None and len(pending) >= sum(parsed):
+                    (size, header_size) = parsed
+                    at -= len(pending) - header_size - size
+                    frame = memoryview(pending)[header_size: header_size + size]
+                    pending = bytearray()
+                    yield frame
+            while at < len(view):
+                parsed = self.parse_header(view, at, header)
+                if parsed is None or at + sum(parsed) > len(view):
+                    break
+                (size, header_size) = parsed
+                yield view[at + header_size: at + header_size + size]
+                at += header_size + size
+            if not pending:
+                pending += view[at:]
+        if pending:
+            raise ValueError('stream ends within a frame, %d bytes' % len(pending))
+
+    @classmethod
+    def varint(self, size):
+        """The LEB128 varint of size, for writing frames."""
+        parts = bytearray()
+        while size >= 0x80:
+            parts.append(size & 0x7f | 0x80)
+            size >>= 7
+        parts.append(size)
+        return bytes(parts)
@@ -0,0 +1,462 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Just enough of git's on-disk format to read and commit files in a local
+# repository without running git: loose and packed objects, trees, commits
+# and refs.  Refs are updated with git's own lock file protocol, so this can
+# safely run alongside git itself.
+#
+
+import os
+import mmap
+import time
+import zlib
+import errno
+import struct
+import socket
+import hashlib
+import binascii
+
+class GitRepo(object):
+    """
+    repo = GitRepo('~/.pyhist')
+    head = repo.read_ref('refs/heads/master')
+    data = repo.read_path(head, '.pyhistory')
+    """
+    tree_mode = b'40000'
+    blob_mode = b'100644'
+
+    # pack object types
+    OBJ_COMMIT = 1
+    OBJ_TREE = 2
+    OBJ_BLOB = 3
+    OBJ_TAG = 4
+    OBJ_OFS_DELTA = 6
+    OBJ_REF_DELTA = 7
+
+    type_names = {
+        OBJ_COMMIT: b'commit',
+        OBJ_TREE: b'tree',
+        OBJ_BLOB: b'blob',
+        OBJ_TAG: b'tag',
+    }
+    type_codes = dict((v, k) for (k, v) in type_names.items())
+
+    def __init__(self, path):
+        path = os.path.expanduser(path)
+        if os.path.isdir(os.path.join(path, '.git')):
+            path = os.path.join(path, '.git')
+        self.path = path
+        self.objects_path = os.path.join(path, 'objects')
+        # index file name -> (binary sha -> offset, pack path, [mmap or None])
+        self._packs = {}
+
+    @classmethod
+    def is_repo(self, path):
+        path = os.path.expanduser(path)
+        return os.path.isfile(os.path.join(path, 'HEAD')) or os.path.isfile(os.path.join(path, '.git', 'HEAD'))
+
+    #
+    # objects
+    #
+    @staticmethod
+    def hash_object(typ, data):
+        header = typ + b' ' + str(len(data)).encode() + b'\0'
+        return hashlib.sha1(header + data).hexdigest()
+
+    def count_loose_objects(self):
+        count = 0
+        for name in os.listdir(self.objects_path):
+            if len(name) == 2:
+                count += len(os.listdir(os.path.join(self.objects_path, name)))
+        return count
+
+    def object_path(self, sha):
+        return os.path.join(self.objects_path, sha[:2], sha[2:])
+
+    def has_object(self, sha):
+        return os.path.exists(self.object_path(sha)) or self._find_packed(sha) is not None
+
+    def write_object(self, typ, data):
+        """Store data as a loose object, returning its hex sha."""
+        sha = self.hash_object(typ, data)
+        path = self.object_path(sha)
+        if not os.path.exists(path):
+            dirname = os.path.dirname(path)
+            if not os.path.isdir(dirname):
+                try:
+                    os.makedirs(dirname)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            header = typ + b' ' + str(len(data)).encode() + b'\0'
+            tmp_path = os.path.join(dirname, 'tmp_obj_' + str(os.getpid()) + '_' + sha[2:8])
+            with open(tmp_path, 'wb') as outfile:
+                outfile.write(zlib.compress(header + data))
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            os.chmod(tmp_path, 0o444)
+            os.rename(tmp_path, path)
+        return sha
+
+    def read_object(self, sha):
+        """Return (type, data) for the object with hex sha."""
+        path = self.object_path(sha)
+        if os.path.exists(path):
+            with open(path, 'rb') as infile:
+                raw = zlib.decompress(infile.read())
+            (header, data) = raw.split(b'\0', 1)
+            (typ, size) = header.split(b' ')
+            result = (typ, data)
+        else:
+            found = self._find_packed(sha)
+            if found is None:
+                raise KeyError(sha)
+            (pack, offset) = found
+            (typ, data) = self._read_packed(pack, offset)
+            result = (self.type_names[typ], data)
+        return result
+
+    #
+    # packs
+    #
+    def _load_packs(self):
+        pack_dir = os.path.join(self.objects_path, 'pack')
+        names = os.listdir(pack_dir) if os.path.isdir(pack_dir) else []
+        for name in names:
+            if name.endswith('.idx') and name not in self._packs:
+                idx_path = os.path.join(pack_dir, name)
+                pack_path = idx_path[:-len('.idx')] + '.pack'
+                if os.path.exists(pack_path):
+                    self._packs[name] = (self._read_index(idx_path), pack_path, [None])
+        return self._packs
+
+    @staticmethod
+    def _read_index(idx_path):
+        with open(idx_path, 'rb') as infile:
+            idx = infile.read()
+        # version 2 index only
+        assert idx[:8] == b'\377tOc\0\0\0\2', idx_path
+        count = struct.unpack('>I', idx[8 + 255 * 4: 8 + 256 * 4])[0]
+        shas_at = 8 + 256 * 4
+        offsets_at = shas_at + count * 20 + count * 4
+        large_at = offsets_at + count * 4
+        shas = [idx[shas_at + i * 20: shas_at + (i + 1) * 20] for i in range(count)]
+        offsets = list(struct.unpack('>' + 'I' * count, idx[offsets_at: large_at]))
+        for (i, offset) in enumerate(offsets):
+            if offset & 0x80000000:
+                j = offset & 0x7fffffff
+                offsets[i] = struct.unpack('>Q', idx[large_at + j * 8: large_at + (j + 1) * 8])[0]
+        return dict(zip(shas, offsets))
+
+    def _find_packed(self, sha):
+        binsha = binascii.unhexlify(sha)
+        for pack in self._load_packs().values():
+            offset = pack[0].get(binsha)
+            if offset is not None:
+                return (pack, offset)
+        return None
+
+    def _read_packed(self, pack, offset):
+        (index, pack_path, data_holder) = pack
+        if data_holder[0] is None:
+            with open(pack_path, 'rb') as infile:
+                data_holder[0] = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+        data = data_holder[0]
+        start = offset
+        c = data[offset]
+        typ = (c >> 4) & 7
+        size = c & 15
+        shift = 4
+        offset += 1
+        while c & 0x80:
+            c = data[offset]
+            size |= (c & 0x7f) << shift
+            shift += 7
+            offset += 1
+        if typ == self.OBJ_OFS_DELTA:
+            c = data[offset]
+            base_delta = c & 0x7f
+            offset += 1
+            while c & 0x80:
+                c = data[offset]
+                base_delta = ((base_delta + 1) << 7) | (c & 0x7f)
+                offset += 1
+            (base_typ, base) = self._read_packed(pack, start - base_delta)
+            result = (base_typ, self._apply_delta(base, self._inflate(data, offset)))
+        elif typ == self.OBJ_REF_DELTA:
+            base_sha = binascii.hexlify(data[offset: offset + 20]).decode()
+            (base_name, base) = self.read_object(base_sha)
+            result = (self.type_codes[base_name], self._apply_delta(base, self._inflate(data, offset + 20)))
+        else:
+            result = (typ, self._inflate(data, offset))
+        return result
+
+    @staticmethod
+    def _inflate(data, offset, step = 16384):
+        """Decompress the zlib stream starting at offset without copying the rest of data."""
+        inflater = zlib.decompressobj()
+        out = []
+        while not inflater.eof:
+            chunk = data[offset: offset + step]
+            if not chunk:
+                break
+            out.append(inflater.decompress(chunk))
+            offset += step
+        return b''.join(out)
+
+    @staticmethod
+    def _apply_delta(base, delta):
+        def varint(i):
+            value = 0
+            shift = 0
+            while True:
+                c = delta[i]
+                i += 1
+                value |= (c & 0x7f) << shift
+                shift += 7
+                if not c & 0x80:
+                    return (value, i)
+        (_, i) = varint(0)
+        (size, i) = varint(i)
+        out = []
+        while i < len(delta):
+            op = delta[i]
+            i += 1
+            if op & 0x80:
+                # copy from base
+                copy_offset = 0
+                copy_size = 0
+                for bit in range(4):
+                    if op & (1 << bit):
+                        copy_offset |= delta[i] << (bit * 8)
+                        i += 1
+                for bit in range(3):
+                    if op & (0x10 << bit):
+                        copy_size |= delta[i] << (bit * 8)
+                        i += 1
+                out.append(base[copy_offset: copy_offset + (copy_size or 0x10000)])
+            else:
+                # insert literal
+                out.append(delta[i: i + op])
+                i += op
+        result = b''.join(out)
+        assert len(result) == size
+        return result
+
+    #
+    # trees
+    #
+    @staticmethod
+    def parse_tree(data):
+        """Return {name: (mode, hex sha)} for a tree object's data."""
+        entries = {}
+        i = 0
+        while i < len(data):
+            space = data.index(b' ', i)
+            nul = data.index(b'\0', space)
+            mode = data[i: space]
+            name = data[space + 1: nul]
+            entries[name] = (mode, binascii.hexlify(data[nul + 1: nul + 21]).decode())
+            i = nul + 21
+        return entries
+
+    def write_tree(self, entries):
+        # git sorts trees as though directory names end with '/'
+        def key(name):
+            return name + b'/' if entries[name][0] == self.tree_mode else name
+        data = b''.join(
+            mode + b' ' + name + b'\0' + binascii.unhexlify(sha)
+            for name in sorted(entries, key = key)
+            for (mode, sha) in [entries[name]]
+        )
+        return self.write_object(b'tree', data)
+
+    def read_tree(self, sha):
+        if sha is None:
+            result = {}
+        else:
+            (typ, data) = self.read_object(sha)
+            result = self.parse_tree(data)
+        return result
+
+    def update_tree(self, tree_sha, changes):
+        """
+        Write a copy of tree_sha with changes applied and return its sha.
+
+        changes maps slash separated paths to blob shas, or to None to remove
+        the path.  Trees left empty are removed.
+        """
+        entries = self.read_tree(tree_sha)
+        subchanges = {}
+        for (path, sha) in changes.items():
+            path = path.encode() if not isinstance(path, bytes) else path
+            if b'/' in path:
+                (head, rest) = path.split(b'/', 1)
+                subchanges.setdefault(head, {})[rest] = sha
+            elif sha is None:
+                entries.pop(path, None)
+            else:
+                entries[path] = (self.blob_mode, sha)
+        for (name, sub) in subchanges.items():
+            old = entries.get(name)
+            subtree = self.update_tree(old[1] if old is not None and old[0] == self.tree_mode else None, sub)
+            if subtree is None:
+                entries.pop(name, None)
+            else:
+                entries[name] = (self.tree_mode, subtree)
+        return self.write_tree(entries) if entries else None
+
+    def find(self, commit_sha, path):
+        """Return the (mode, sha) tree entry for path in a commit, or None."""
+        entry = (self.tree_mode, self.read_commit(commit_sha)['tree'])
+        for name in path.encode().split(b'/'):
+            entry = self.read_tree(entry[1]).get(name) if entry[0] == self.tree_mode else None
+            if entry is None:
+                break
+        return entry
+
+    def read_path(self, commit_sha, path):
+        """Return the contents of the file at path in a commit, or None."""
+        result = None
+        if commit_sha is not None:
+            entry = self.find(commit_sha, path)
+            if entry is not None:
+                result = self.read_object(entry[1])[1]
+        return result
+
+    #
+    # commits
+    #
+    def read_commit(self, sha):
+        (typ, data) = self.read_object(sha)
+        (header, message) = data.split(b'\n\n', 1)
+        result = {'parents': [], 'message': message}
+        for line in header.split(b'\n'):
+            (key, value) = line.split(b' ', 1)
+            if key == b'parent':
+                result['parents'].append(value.decode())
+            elif key == b'tree':
+                result['tree'] = value.decode()
+        return result
+
+    def count_commits(self, sha, limit):
+        """Length of the first-parent chain from a commit, counting at most limit."""
+        count = 0
+        while sha is not None and count < limit:
+            count += 1
+            parents = self.read_commit(sha)['parents']
+            sha = parents[0] if parents else None
+        return count
+
+    @staticmethod
+    def get_identity(kind):
+        """
+        Return 'Name <email>' for kind 'AUTHOR' or 'COMMITTER', looked up the
+        way git does: environment, then global config, then user@host.
+        """
+        name = os.environ.get('GIT_' + kind + '_NAME')
+        email = os.environ.get('GIT_' + kind + '_EMAIL')
+        if name is None or email is None:
+            config = GitRepo.read_user_config()
+            name = name or config.get('name')
+            email = email or config.get('email')
+        if name is None or email is None:
+            import getpass
+            user = getpass.getuser()
+            name = name or user
+            email = email or user + '@' + socket.gethostname()
+        return name + ' <' + email + '>'
+
+    @staticmethod
+    def read_user_config():
+        """The [user] section of the global git config files."""
+        xdg = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+        paths = [os.path.join(xdg, 'git', 'config'), os.path.expanduser('~/.gitconfig')]
+        result = {}
+        for path in paths:
+            if os.path.exists(path):
+                section = None
+                with open(path) as infile:
+                    for line in infile:
+                        line = line.strip()
+                        if line.startswith('['):
+                            section = line.strip('[]').strip().lower()
+                        elif section == 'user' and '=' in line:
+                            (key, value) = line.split('=', 1)
+                            result[key.strip().lower()] = value.strip().strip('"')
+        return result
+
+    def write_commit(self, tree_sha, parents, message):
+        now = int(time.time())
+        offset = -(time.altzone if time.localtime(now).tm_isdst > 0 else time.timezone)
+        tz = '%s%02d%02d' % ('-' if offset < 0 else '+', abs(offset) // 3600, abs(offset) // 60 % 60)
+        stamp = ' ' + str(now) + ' ' + tz
+        lines = ['tree ' + tree_sha]
+        lines += ['parent ' + parent for parent in parents]
+        lines += [
+            'author ' + self.get_identity('AUTHOR') + stamp,
+            'committer ' + self.get_identity('COMMITTER') + stamp,
+        ]
+        data = ('\n'.join(lines) + '\n\n' + message.rstrip('\n') + '\n').encode()
+        return self.write_object(b'commit', data)
+
+    #
+    # refs
+    #
+    def read_ref(self, ref):
+        """Return the hex sha a ref points to, or None."""
+        path = os.path.join(self.path, ref)
+        result = None
+        if os.path.exists(path):
+            with open(path) as infile:
+                value = infile.read().strip()
+            if value.startswith('ref: '):
+                result = self.read_ref(value[len('ref: '):])
+            else:
+                result = value or None
+        else:
+            packed_path = os.path.join(self.path, 'packed-refs')
+            if os.path.exists(packed_path):
+                with open(packed_path) as infile:
+                    for line in infile:
+                        if line[:1] not in ('#', '^') and line.rstrip('\n').endswith(' ' + ref):
+                            result = line.split(' ', 1)[0]
+                            break
+        return result
+
+    def update_ref(self, ref, new_sha, old_sha):
+        """
+        Point ref at new_sha if it still points at old_sha (None if it
+        doesn't exist yet), using a ref.lock file as git does.
+
+        Returns False if the ref moved or someone else holds the lock.
+        """
+        path = os.path.join(self.path, ref)
+        lock_path = path + '.lock'
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        try:
+            fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return False
+        is_updated = False
+        try:
+            if self.read_ref(ref) == old_sha:
+                os.write(fd, (new_sha + '\n').encode())
+                os.fsync(fd)
+                os.close(fd)
+                fd = None
+                os.rename(lock_path, path)
+                is_updated = True
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if not is_updated:
+                os.unlink(lock_path)
+        return is_updated
@@ -10,11 +10,16 @@ from functools import reduce
 import inspect
 
 class History(object):
+    # set by the console to the RepoHistory whose store holds the history
+    repo_history = None
+
     @staticmethod
     def get_last(line_count):
+        if History.repo_history is not None:
+            return History.repo_history.get_last(line_count)
         l = readline.get_current_history_length()
         lines = []
-        for i in range(max(l - line_count, 0), l):
+        for i in range(max(l - line_count, 0) + 1, l + 1):
             line = readline.get_history_item(i)
             lines.append(line)
         return lines
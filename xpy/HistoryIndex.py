@@ -0,0 +1,245 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Persistent trigram index over merged history, for substring search over
+# hundreds of thousands of lines without scanning them.
+#
+# The index is a directory of immutable segment files plus a manifest.  Each
+# segment covers the entries of one or more sources (a journal segment name,
+# or a byte range of a .pyhistory named path@offset), so sources can be added as they're
+# committed and dropped once compaction moves their lines into .pyhistory.
+# Segments are memory-mapped at search time and merged once there are too
+# many of them.
+#
+# Segment layout, native byte order:
+#
+#   header      magic, line count, trigram count, postings count, text size
+#   keys        u32[trigrams]      sorted lowercase utf-8 trigrams
+#   starts      u32[trigrams + 1]  start of each key's postings
+#   postings    u32[postings]      line numbers containing the trigram
+#   times       u32[lines]         entry timestamps
+#   offsets     u64[lines + 1]     start of each line in text
+#   text        utf-8 lines
+#
+
+import os
+import json
+import mmap
+import bisect
+import struct
+
+from .FileLock import FileLock
+from .PackedArray import PackedArray
+
+class HistoryIndex(object):
+    magic = b'XPYTRI1\0'
+    header = struct.Struct('=8sIIIQ')
+    # merge all segments once there are more than this many
+    max_segments = 8
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest')
+        self.lock_path = os.path.join(path, 'lock')
+        self.manifest = self.empty_manifest()
+        # segment file -> (mmap, arrays)
+        self._maps = {}
+
+    @staticmethod
+    def empty_manifest():
+        return {
+            # history path -> [bytes covered, their sha1]
+            'bases': {},
+            # history path -> [size, mtime] when last indexed
+            'stats': {},
+            # [{'file': name, 'sources': [[source, first line, line count]]}]
+            'segments': [],
+            'next': 0,
+        }
+
+    def lock(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        return FileLock(self.lock_path)
+
+    def load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as infile:
+                self.manifest = json.load(infile)
+            if 'bases' not in self.manifest:
+                # written before sharding; start over
+                self.manifest = dict(self.empty_manifest(), next = self.manifest['next'])
+            self.manifest.setdefault('stats', {})
+        else:
+            self.manifest = self.empty_manifest()
+        return self
+
+    def save(self):
+        tmp_path = self.manifest_path + '.' + str(os.getpid())
+        with open(tmp_path, 'w') as outfile:
+            json.dump(self.manifest, outfile)
+        os.rename(tmp_path, self.manifest_path)
+        #
+        # remove segment files no longer referenced
+        #
+        files = set(segment['file'] for segment in self.manifest['segments'])
+        for name in os.listdir(self.path):
+            if name.endswith('.seg') and name not in files:
+                os.unlink(os.path.join(self.path, name))
+
+    def sources(self):
+        return set(source for segment in self.manifest['segments'] for (source, first, count) in segment['sources'])
+
+    #
+    # building
+    #
+    @staticmethod
+    def trigrams(line):
+        text = line.lower().encode('utf-8')
+        # int.from_bytes is python 3 only
+        return set(struct.unpack('>I', b'\0' + text[i: i + 3])[0] for i in range(len(text) - 2))
+
+    def write_segment(self, entries):
+        """Write entries, [(timestamp, line)], to a new segment file and return its name."""
+        postings = {}
+        for (i, (t, line)) in enumerate(entries):
+            for key in self.trigrams(line):
+                postings.setdefault(key, []).append(i)
+        keys = sorted(postings)
+        starts = [0]
+        flat = []
+        for key in keys:
+            flat.extend(postings[key])
+            starts.append(len(flat))
+        times = [max(0, min(int(t), 0xffffffff)) for (t, line) in entries]
+        encoded = [line.encode('utf-8') for (t, line) in entries]
+        offsets = [0]
+        for line in encoded:
+            offsets.append(offsets[-1] + len(line))
+        text = b''.join(encoded)
+        name = '%d.seg' % self.manifest['next']
+        self.manifest['next'] += 1
+        with open(os.path.join(self.path, name), 'wb') as outfile:
+            outfile.write(self.header.pack(self.magic, len(entries), len(keys), len(flat), len(text)))
+            for (fmt, values) in (('I', keys), ('I', starts), ('I', flat), ('I', times), ('Q', offsets)):
+                outfile.write(PackedArray.pack(fmt, values))
+            outfile.write(text)
+        return name
+
+    def add(self, sources):
+        """Index sources, [(source name, [(timestamp, line)])], as one new segment."""
+        entries = []
+        table = []
+        for (source, source_entries) in sources:
+            table.append([source, len(entries), len(source_entries)])
+            entries.extend(source_entries)
+        if entries:
+            self.manifest['segments'].append({'file': self.write_segment(entries), 'sources': table})
+        if len(self.manifest['segments']) > self.max_segments:
+            self.merge()
+
+    def drop(self, names):
+        """Stop returning lines from the named sources; they're removed at the next merge."""
+        names = set(names)
+        for segment in self.manifest['segments']:
+            segment['sources'] = [s for s in segment['sources'] if s[0] not in names]
+        self.manifest['segments'] = [segment for segment in self.manifest['segments'] if segment['sources']]
+
+    def merge(self):
+        """Rewrite all live sources into a single segment."""
+        sources = []
+        for segment in self.manifest['segments']:
+            lines = self.read_lines(segment['file'])
+            for (source, first, count) in segment['sources']:
+                sources.append((source, lines[first: first + count]))
+        self.manifest['segments'] = []
+        self.add(sources)
+
+    #
+    # searching
+    #
+    def open_segment(self, name):
+        if name not in self._maps:
+            with open(os.path.join(self.path, name), 'rb') as infile:
+                mm = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+            (magic, line_count, key_count, posting_count, text_len) = self.header.unpack_from(mm)
+            assert magic == self.magic, name
+            at = self.header.size
+            arrays = []
+            for (fmt, count) in (('I', key_count), ('I', key_count + 1), ('I', posting_count), ('I', line_count), ('Q', line_count + 1)):
+                arrays.append(PackedArray.view(mm, at, fmt, count))
+                at += PackedArray.itemsize(fmt) * count
+            arrays.append(PackedArray.view_bytes(mm, at, text_len))
+            self._maps[name] = (mm, arrays)
+        return self._maps[name][1]
+
+    def read_lines(self, name):
+        (keys, starts, postings, times, offsets, text) = self.open_segment(name)
+        return [(times[i], bytes(text[offsets[i]: offsets[i + 1]]).decode('utf-8')) for i in range(len(times))]
+
+    def candidates(self, name, pattern):
+        """Line numbers in a segment which contain every trigram of pattern."""
+        (keys, starts, postings, times, offsets, text) = self.open_segment(name)
+        spans = []
+        for key in self.trigrams(pattern):
+            i = bisect.bisect_left(keys, key)
+            if i == len(keys) or keys[i] != key:
+                return []
+            spans.append((starts[i + 1] - starts[i], starts[i]))
+        #
+        # intersect starting from the rarest trigram
+        #
+        result = None
+        for (count, start) in sorted(spans):
+            found = postings[start: start + count]
+            result = set(found) if result is None else result.intersection(found)
+            if not result:
+                return []
+        return range(len(times)) if result is None else sorted(result)
+
+    def search(self, pattern, limit = 20, extra = ()):
+        """
+        Return up to limit distinct lines containing pattern, ignoring case,
+        as [(line, latest timestamp, count)].  Entries in extra, [(timestamp,
+        line)], which aren't indexed yet are scanned as well.
+
+        Lines starting with the pattern rank first, then the most recently
+        used, then the most often used.
+        """
+        needle = pattern.lower()
+        # line -> (latest timestamp, count, position of the last occurrence)
+        matches = {}
+        position = [0]
+        def found(t, line):
+            position[0] += 1
+            if needle in line.lower():
+                (latest, count, seen) = matches.get(line, (0, 0, 0))
+                matches[line] = (max(latest, t), count + 1, position[0])
+        for segment in self.manifest['segments']:
+            (keys, starts, postings, times, offsets, text) = self.open_segment(segment['file'])
+            ranges = [range(first, first + count) for (source, first, count) in segment['sources']]
+            for i in self.candidates(segment['file'], pattern):
+                if any(i in r for r in ranges):
+                    found(times[i], bytes(text[offsets[i]: offsets[i + 1]]).decode('utf-8'))
+        for (t, line) in extra:
+            found(t, line)
+        #
+        # timestamps only have a resolution of a second, so ties go to the
+        # line seen last
+        #
+        ranked = sorted(matches.items(), key = lambda kv: (
+            not kv[0].lower().lstrip().startswith(needle),
+            -kv[1][0],
+            -kv[1][1],
+            -kv[1][2],
+        ))
+        return [(line, latest, count) for (line, (latest, count, seen)) in ranked[:limit]]
+
+    def close(self):
+        for (mm, arrays) in self._maps.values():
+            for a in reversed(arrays):
+                a.release()
+            mm.close()
+        self._maps = {}
@@ -0,0 +1,217 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Append-only history journal.
+#
+# Every console session appends its lines to its own segment file as they
+# are entered, fsync'ing each append, so nothing is lost if the process is
+# killed.  A session holds a flock on its segment while it is open, which is
+# how closed (committable) segments are told apart from live ones.
+#
+# Entries use readline's timestamped history format:
+#
+#   #1514764800
+#   print('hello')
+#
+# Lines without a timestamp (older history files) get a timestamp of 0.
+#
+
+import os
+import re
+import time
+import errno
+import fcntl
+import socket
+
+class HistoryJournal(object):
+    timestamp_pat = re.compile(b'^#[0-9]+$')
+    continuation_pat = re.compile('^(else|elif|except|finally)\\b')
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.name = None
+
+    @staticmethod
+    def segment_name():
+        # sorts in time order
+        return '%016d.%s.%d' % (int(time.time() * 1e6), socket.gethostname(), os.getpid())
+
+    @staticmethod
+    def format_entries(lines, t = None):
+        """Serialize lines as timestamped entries.  Embedded newlines split an entry."""
+        if t is None:
+            t = time.time()
+        stamp = ('#%d\n' % int(t)).encode()
+        return b''.join(
+            stamp + part.encode() + b'\n'
+            for line in lines
+            for part in line.split('\n')
+        )
+
+    @classmethod
+    def parse(self, data):
+        """Return [(timestamp, line)] for the entries in data."""
+        entries = []
+        t = None
+        for line in data.split(b'\n'):
+            if self.timestamp_pat.match(line) and t is None:
+                t = int(line[1:])
+            elif line or t is not None:
+                entries.append((t or 0, line.decode('utf-8', 'replace')))
+                t = None
+        return entries
+
+    @staticmethod
+    def format(entries):
+        """Serialize [(timestamp, line)], the inverse of parse."""
+        return b''.join(
+            (('#%d\n' % t) if t else '').encode() + line.encode() + b'\n'
+            for (t, line) in entries
+        )
+
+    @classmethod
+    def statements(self, entries):
+        """Group entries into statements, i.e. a line and its indented or else/except continuations."""
+        groups = []
+        for (t, line) in entries:
+            if groups and (line[:1].isspace() or self.continuation_pat.match(line)):
+                groups[-1].append((t, line))
+            else:
+                groups.append([(t, line)])
+        return groups
+
+    @classmethod
+    def retain(self, entries, max_entries = None, max_age = None, is_dedup = True):
+        """
+        Apply a retention policy to [(timestamp, line)]: order statements by
+        timestamp, keep only the last use of each, drop those more than
+        max_age seconds older than the newest, then keep at most the newest
+        max_entries lines.
+
+        The result only depends on the entries, not the clock, so sessions
+        compacting the same history agree on it, given entries in an order
+        which doesn't depend on the session either, see merge.
+        """
+        groups = sorted(self.statements(entries), key = lambda group: group[0][0])
+        if is_dedup:
+            seen = set()
+            kept = []
+            for group in reversed(groups):
+                key = tuple(line for (t, line) in group)
+                if key not in seen:
+                    seen.add(key)
+                    kept.append(group)
+            groups = kept[::-1]
+        if max_age is not None and groups:
+            oldest = groups[-1][0][0] - max_age
+            # untimestamped lines have no age
+            groups = [group for group in groups if group[0][0] == 0 or group[0][0] >= oldest]
+        if max_entries is not None:
+            count = 0
+            for i in range(len(groups) - 1, -1, -1):
+                count += len(groups[i])
+                if count > max_entries:
+                    groups = groups[i + 1:]
+                    break
+        return [entry for group in groups for entry in group]
+
+    @classmethod
+    def merge(self, sources):
+        """
+        [(timestamp, line)] for history files, [(name, data)], with their
+        statements in a total order: by timestamp, then source name, then
+        position in the source.  Timestamps only have a resolution of a
+        second, so without the tiebreak the result would depend on the order
+        sources come in.
+        """
+        keyed = []
+        for (name, data) in sources:
+            for (i, group) in enumerate(self.statements(self.parse(data))):
+                keyed.append(((group[0][0], name, i), group))
+        keyed.sort(key = lambda item: item[0])
+        return [entry for (key, group) in keyed for entry in group]
+
+    @staticmethod
+    def concat(parts):
+        """Join history files, making sure each one ends with a newline."""
+        return b''.join(part if not part or part.endswith(b'\n') else part + b'\n' for part in parts)
+
+    #
+    # this session's segment
+    #
+    def open(self, suffix = ''):
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        name = self.segment_name() + suffix
+        #
+        # lock before the segment becomes visible under its real name so it
+        # can't be mistaken for a closed one
+        #
+        tmp_path = os.path.join(self.path, '.' + name)
+        self.fd = os.open(tmp_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        os.rename(tmp_path, os.path.join(self.path, name))
+        self.name = name
+
+    def append(self, lines):
+        if lines:
+            os.write(self.fd, self.format_entries(lines))
+            os.fsync(self.fd)
+
+    def close(self):
+        """Close this session's segment, which makes it committable."""
+        if self.fd is not None:
+            is_empty = os.fstat(self.fd).st_size == 0
+            if is_empty:
+                os.unlink(os.path.join(self.path, self.name))
+            os.close(self.fd)
+            self.fd = None
+
+    #
+    # all segments
+    #
+    def is_live(self, name):
+        """True if a running session still holds the segment open."""
+        try:
+            fd = os.open(os.path.join(self.path, name), os.O_RDONLY)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            result = True
+        else:
+            result = False
+        finally:
+            os.close(fd)
+        return result
+
+    def segments(self):
+        names = os.listdir(self.path) if os.path.isdir(self.path) else []
+        return sorted(name for name in names if not name.startswith('.'))
+
+    def closed_segments(self):
+        return [name for name in self.segments() if not self.is_live(name)]
+
+    def read_segment(self, name):
+        with open(os.path.join(self.path, name), 'rb') as infile:
+            return infile.read()
+
+    def remove(self, names):
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
@@ -0,0 +1,171 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Append-only columnar log of executed statements.
+#
+# Each column is its own file of fixed-width values, so a query reads only
+# the columns it needs and filters them with vectorized operations (numpy if
+# it's installed, otherwise lists and comprehensions):
+#
+#   t0          f64  start time
+#   duration    f64  seconds
+#   ok          u8   1 if it ran without raising
+#   context     u32  interned module context, see XPY.get_exec_name
+#   cwd         u32  interned working directory
+#   source      u64  offset of the statement in text
+#   size        u32  its length in bytes
+#
+# Interned strings are appended to names, one JSON string per line, and
+# statements to text.  Sessions on a host append under a lock; a row only
+# counts once every column has it, and an append first truncates any
+# columns left longer by a session killed mid-append.
+#
+
+import os
+import json
+import collections
+
+from .FileLock import FileLock
+from .PackedArray import PackedArray
+
+class HistoryRecords(object):
+    columns = (
+        ('t0', 'd'),
+        ('duration', 'd'),
+        ('ok', 'B'),
+        ('context', 'I'),
+        ('cwd', 'I'),
+        ('source', 'Q'),
+        ('size', 'I'),
+    )
+    Record = collections.namedtuple('Record', 't0 duration ok context cwd source')
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = os.path.join(path, 'lock')
+        self.names_path = os.path.join(path, 'names')
+        self.text_path = os.path.join(path, 'text')
+        # interned string -> id, and back
+        self.ids = {}
+        self.names = []
+
+    def column_path(self, name):
+        return os.path.join(self.path, name + '.col')
+
+    def row_count(self):
+        """Number of complete rows."""
+        counts = []
+        for (name, code) in self.columns:
+            path = self.column_path(name)
+            counts.append(os.path.getsize(path) // PackedArray.itemsize(code) if os.path.exists(path) else 0)
+        return min(counts)
+
+    def load_names(self):
+        """Read names interned by other sessions since the last call."""
+        if os.path.exists(self.names_path):
+            with open(self.names_path) as infile:
+                for (i, line) in enumerate(infile):
+                    if i >= len(self.names):
+                        self.names.append(json.loads(line))
+                        self.ids[self.names[-1]] = i
+
+    def intern(self, name, outfile):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+            outfile.write(json.dumps(name) + '\n')
+        return self.ids[name]
+
+    def append(self, t0, duration, ok, context, cwd, source):
+        """Record one executed statement."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with FileLock(self.lock_path):
+            rows = self.row_count()
+            self.load_names()
+            with open(self.names_path, 'a') as names:
+                ids = (self.intern(context, names), self.intern(cwd, names))
+            data = source.encode('utf-8')
+            with open(self.text_path, 'ab') as text:
+                offset = text.tell()
+                text.write(data)
+            values = (t0, duration, int(bool(ok))) + ids + (offset, len(data))
+            for ((name, code), value) in zip(self.columns, values):
+                with open(self.column_path(name), 'ab') as outfile:
+                    outfile.truncate(rows * PackedArray.itemsize(code))
+                    outfile.write(PackedArray.pack(code, [value]))
+
+    #
+    # queries
+    #
+    def read_column(self, name, rows):
+        """The first rows values of a column, as a numpy array if numpy is installed, else a list."""
+        code = dict(self.columns)[name]
+        try:
+            import numpy as np
+        except ImportError as e:
+            if not rows:
+                return []
+            with open(self.column_path(name), 'rb') as infile:
+                return PackedArray.unpack(code, infile.read(rows * PackedArray.itemsize(code)))
+        else:
+            if not rows:
+                return np.zeros(0, dtype = code)
+            return np.fromfile(self.column_path(name), dtype = code, count = rows)
+
+    def select(self, since = None, context = None, ok = None):
+        """Row numbers of statements started at or after since, in a context, with ok set or not."""
+        rows = self.row_count()
+        self.load_names()
+        tests = []
+        if since is not None:
+            tests.append(('t0', lambda column: column >= since))
+        if context is not None:
+            tests.append(('context', lambda column: column == self.ids.get(context, -1)))
+        if ok is not None:
+            tests.append(('ok', lambda column: column == int(bool(ok))))
+        try:
+            import numpy as np
+        except ImportError as e:
+            selected = range(rows)
+            for (name, test) in tests:
+                column = self.read_column(name, rows)
+                selected = [i for i in selected if test(column[i])]
+            return list(selected)
+        else:
+            mask = np.ones(rows, dtype = bool)
+            for (name, test) in tests:
+                mask &= test(self.read_column(name, rows))
+            return np.nonzero(mask)[0].tolist()
+
+    def read(self, row_numbers):
+        """Records for row numbers."""
+        rows = self.row_count()
+        columns = [self.read_column(name, rows) for (name, code) in self.columns]
+        records = []
+        with open(self.text_path, 'rb') as text:
+            for i in row_numbers:
+                (t0, duration, ok, context, cwd, offset, size) = [column[i] for column in columns]
+                text.seek(offset)
+                source = text.read(size).decode('utf-8', 'replace')
+                records.append(self.Record(float(t0), float(duration), bool(ok), self.names[context], self.names[cwd], source))
+        return records
+
+    def slowest(self, count = 10, since = None, context = None):
+        """The count slowest statements, slowest first."""
+        selected = self.select(since, context)
+        durations = self.read_column('duration', self.row_count())
+        try:
+            import numpy as np
+        except ImportError as e:
+            selected.sort(key = lambda i: -durations[i])
+        else:
+            selected = np.array(selected, dtype = int)
+            selected = selected[np.argsort(-durations[selected], kind = 'stable')].tolist()
+        return self.read(selected[:count])
+
+    def failures(self, context = None, since = None):
+        """Statements which raised, oldest first."""
+        return self.read(self.select(since, context, ok = False))
@@ -0,0 +1,74 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Read-only store of history lines kept memory-mapped rather than in
+# readline, so only a window of recent lines needs to be loaded.
+#
+# The file is unlinked as soon as it's mapped, so nothing is left behind
+# however the session ends.
+#
+# Layout, native byte order:
+#
+#   count       u64
+#   offsets     u64[count + 1]  start of each line in text
+#   text        utf-8 lines
+#
+
+import os
+import mmap
+import struct
+
+from .PackedArray import PackedArray
+
+class HistoryStore(object):
+    header = struct.Struct('=Q')
+
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+        self.offsets = None
+        self.text = None
+
+    def write(self, lines):
+        """Replace the store's contents with lines."""
+        self.close()
+        encoded = [line.encode('utf-8') for line in lines]
+        offsets = [0]
+        for line in encoded:
+            offsets.append(offsets[-1] + len(line))
+        with open(self.path, 'wb+') as outfile:
+            outfile.write(self.header.pack(len(encoded)))
+            outfile.write(PackedArray.pack('Q', offsets))
+            outfile.write(b''.join(encoded))
+            outfile.flush()
+            # mmap can't map an empty file
+            if len(encoded):
+                self.mm = mmap.mmap(outfile.fileno(), 0, access = mmap.ACCESS_READ)
+        os.unlink(self.path)
+        if self.mm is not None:
+            at = self.header.size + PackedArray.itemsize('Q') * len(offsets)
+            self.offsets = PackedArray.view(self.mm, self.header.size, 'Q', len(offsets))
+            self.text = PackedArray.view_bytes(self.mm, at, offsets[-1])
+
+    def __len__(self):
+        return len(self.offsets) - 1 if self.offsets is not None else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self.text[self.offsets[i]: self.offsets[i + 1]]).decode('utf-8')
+
+    def close(self):
+        if self.mm is not None:
+            self.offsets.release()
+            self.text.release()
+            self.mm.close()
+        self.mm = None
+        self.offsets = None
+        self.text = None
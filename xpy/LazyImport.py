@@ -0,0 +1,69 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+import importlib
+
+class LazyImport(object):
+    """
+    Descriptor which imports a module (and optionally one of its attributes)
+    on first access, then replaces itself on the owning class with the value.
+
+    class ConsoleImports(object):
+        Clip = LazyImport('.Clip', 'Clip')
+
+    The import is relative to the xpy package unless another package is
+    given.
+    """
+    def __init__(self, modname, name = None, package = 'xpy'):
+        self.modname = modname
+        self.name = name
+        self.package = package
+        # attribute name on the owning class, filled in by __set_name__
+        self.attr = None
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def resolve(self):
+        mod = importlib.import_module(self.modname, self.package)
+        if self.name is None:
+            result = mod
+        else:
+            result = getattr(mod, self.name)
+        return result
+
+    def __get__(self, obj = None, typ = None):
+        value = self.resolve()
+        if typ is not None and self.attr is not None:
+            #
+            # later lookups go straight to the class dict
+            #
+            setattr(typ, self.attr, value)
+        return value
+
+    @classmethod
+    def names(self, cls):
+        """Public names bound on cls, lazy or not, without resolving them."""
+        return [k for k in cls.__dict__ if not k.startswith('_')]
+
+    @classmethod
+    def module_getattr(self, modname, table):
+        """
+        Return a PEP 562 module __getattr__ for the module named modname.
+
+        table maps exported names to (relative module, attribute) pairs.
+        Resolved values are cached in the module dict so __getattr__ is only
+        consulted once per name.
+        """
+        import sys
+
+        def __getattr__(name):
+            if name not in table:
+                raise AttributeError('module ' + repr(modname) + ' has no attribute ' + repr(name))
+            (submodname, attr) = table[name]
+            value = LazyImport(submodname, attr, modname).resolve()
+            setattr(sys.modules[modname], name, value)
+            return value
+
+        return __getattr__
@@ -0,0 +1,170 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Names of installed modules, for completing import statements.
+#
+# Each directory on sys.path, and each package directory looked into, is
+# listed with pkgutil.iter_modules and its modules kept by path along with
+# the directory's mtime, which changes whenever an entry is added or
+# removed.  The listings are saved to a JSON file, so a new console starts
+# with them, and a background thread re-lists the directories whose mtimes
+# have changed, so the prompt thread doesn't walk site-packages.
+#
+#   import nu<Tab>          from numpy.li<Tab>       from numpy import li<Tab>
+#
+
+import os
+import re
+import sys
+import json
+import pkgutil
+import threading
+
+class ModuleIndex(object):
+    version = 1
+    import_pat = re.compile('^\\s*import\\s+(?:[\\w.]+\\s*(?:as\\s+\\w+\\s*)?,\\s*)*([\\w.]*)$')
+    from_pat = re.compile('^\\s*from\\s+([\\w.]*)$')
+    from_import_pat = re.compile('^\\s*from\\s+([\\w.]+)\\s+import\\s+(?:\\(?\\s*)?(?:\\w+\\s*(?:as\\s+\\w+\\s*)?,\\s*)*(\\w*)$')
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        # directory -> (mtime, {module name: is package})
+        self.dirs = {}
+        self.thread = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path) as infile:
+                cache = json.load(infile)
+        except (IOError, OSError, ValueError) as e:
+            return
+        if cache.get('version') == self.version:
+            self.dirs = dict((path, (mtime, dict(modules))) for (path, (mtime, modules)) in cache['dirs'].items())
+
+    def save(self):
+        parent = os.path.dirname(self.cache_path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        cache = {
+            'version': self.version,
+            'dirs': dict((path, [mtime, sorted(modules.items())]) for (path, (mtime, modules)) in self.dirs.items()),
+        }
+        tmp_path = '%s.%d' % (self.cache_path, os.getpid())
+        with open(tmp_path, 'w') as outfile:
+            json.dump(cache, outfile)
+        os.rename(tmp_path, self.cache_path)
+
+    @staticmethod
+    def get_mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError as e:
+            return None
+
+    @staticmethod
+    def list_dir(path):
+        """{module name: is package} for the modules in the directory or zip file at path."""
+        return dict((name, is_package) for (finder, name, is_package) in pkgutil.iter_modules([path]))
+
+    def get_dir(self, path, is_listing = True):
+        """The modules in path, from the index if it's current, listing it if is_listing."""
+        entry = self.dirs.get(path)
+        if entry is not None:
+            return entry[1]
+        if not is_listing:
+            return {}
+        mtime = self.get_mtime(path)
+        modules = self.list_dir(path) if mtime is not None else {}
+        # copied, as the refresh thread may be replacing dirs
+        dirs = dict(self.dirs)
+        dirs[path] = (mtime, modules)
+        self.dirs = dirs
+        return modules
+
+    #
+    # refreshing
+    #
+    def refresh(self, paths = None):
+        """Re-list the directories in paths, by default sys.path, and those in the index whose mtimes have changed, then save."""
+        paths = [os.path.abspath(path or '.') for path in (sys.path if paths is None else paths)]
+        dirs = dict(self.dirs)
+        is_changed = False
+        for path in set(paths) | set(dirs):
+            mtime = self.get_mtime(path)
+            if mtime is None:
+                is_changed = is_changed or path in dirs
+                dirs.pop(path, None)
+            elif path not in dirs or dirs[path][0] != mtime:
+                dirs[path] = (mtime, self.list_dir(path))
+                is_changed = True
+        # merged, in case the prompt thread listed a package meanwhile
+        for (path, entry) in self.dirs.items():
+            dirs.setdefault(path, entry)
+        self.dirs = dirs
+        if is_changed:
+            self.save()
+        return is_changed
+
+    def start_refresh(self):
+        """Refresh in a background thread."""
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target = self.refresh_quietly, name = 'xpy-module-index')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            pass
+
+    #
+    # lookups
+    #
+    def get_package_dirs(self, package):
+        """Directories of a dotted package, without importing it."""
+        module = sys.modules.get(package)
+        if module is not None and isinstance(getattr(module, '__path__', None), list):
+            return list(module.__path__)
+        if package.startswith('.'):
+            # relative to a package the console doesn't know
+            return []
+        dirs = [os.path.abspath(path or '.') for path in sys.path]
+        for (i, name) in enumerate(package.split('.')):
+            #
+            # sys.path entries only as the refresh thread listed them, but
+            # a package's directory can be listed here
+            #
+            dirs = [os.path.join(path, name) for path in dirs if self.get_dir(path, i > 0).get(name)]
+        return [path for path in dirs if os.path.isdir(path)]
+
+    def get_modules(self, package = None):
+        """Names of top level modules, or a package's submodules."""
+        if package is None:
+            names = set(sys.builtin_module_names)
+            for path in sys.path:
+                names.update(self.get_dir(os.path.abspath(path or '.'), False))
+            return names
+        names = set()
+        for path in self.get_package_dirs(package):
+            names.update(self.get_dir(path))
+        return names
+
+    def complete_module(self, text):
+        """Dotted module names starting with text."""
+        (package, dot, prefix) = text.rpartition('.')
+        names = self.get_modules(package or None)
+        return sorted(package + dot + name for name in names if name.startswith(prefix))
+
+    def complete(self, line, text):
+        """Completions of text, the word before the cursor, if line is an import statement up to it, else None."""
+        match = self.import_pat.match(line) or self.from_pat.match(line)
+        if match is not None:
+            return [name[len(match.group(1)) - len(text):] for name in self.complete_module(match.group(1))]
+        match = self.from_import_pat.match(line)
+        if match is not None:
+            return sorted(name for name in self.get_modules(match.group(1)) if name.startswith(match.group(2)))
+        return None
@@ -0,0 +1,91 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Sorted index of the names in a console's namespaces, for completing a
+# prefix with bisect rather than scanning every name.
+#
+# update() diffs each namespace's keys against those it saw last and
+# inserts or removes just the difference, so it's cheap after a statement
+# which binds a few names; a larger change, like `from numpy import *`,
+# re-sorts instead.  Finding deleted names takes a pass over the old names,
+# but new ones are found from the end of the namespace, see find_new.
+#
+
+import bisect
+
+class NameIndex(object):
+    # changes beyond which update re-sorts rather than inserting one by one
+    max_inserts = 1000
+
+    def __init__(self, namespaces):
+        self.rebuild(namespaces)
+
+    def rebuild(self, namespaces):
+        """Index the names in namespaces, a namespace listed twice counting once."""
+        self.namespaces = []
+        for namespace in namespaces:
+            if not any(namespace is seen for seen in self.namespaces):
+                self.namespaces.append(namespace)
+        self.keys = [set(namespace) for namespace in self.namespaces]
+        # name -> number of namespaces it's in
+        self.counts = {}
+        for keys in self.keys:
+            for name in keys:
+                self.counts[name] = self.counts.get(name, 0) + 1
+        self.names = sorted(self.counts)
+
+    def update(self):
+        """Catch up with names bound or deleted since the last update."""
+        added = []
+        removed = []
+        for (keys, namespace) in zip(self.keys, self.namespaces):
+            gone = keys.difference(namespace)
+            new = self.find_new(namespace, keys, len(namespace) - len(keys) + len(gone))
+            for name in new:
+                self.counts[name] = self.counts.get(name, 0) + 1
+                if self.counts[name] == 1:
+                    added.append(name)
+            for name in gone:
+                self.counts[name] -= 1
+                if not self.counts[name]:
+                    del self.counts[name]
+                    removed.append(name)
+            keys |= new
+            keys -= gone
+        if len(added) + len(removed) > self.max_inserts:
+            self.names = sorted(self.counts)
+        else:
+            for name in removed:
+                del self.names[bisect.bisect_left(self.names, name)]
+            for name in added:
+                bisect.insort(self.names, name)
+        return (added, removed)
+
+    def find_new(self, namespace, keys, count):
+        """The count names in namespace which aren't in keys."""
+        if not count:
+            return set()
+        if type(namespace) is dict and hasattr(dict, '__reversed__'):
+            #
+            # dicts keep insertion order, so names bound since keys was
+            # taken are the last ones, among any old names rebound after
+            # being deleted
+            #
+            new = set()
+            for name in reversed(namespace):
+                if name not in keys:
+                    new.add(name)
+                    if len(new) == count:
+                        break
+            return new
+        return set(namespace) - keys
+
+    def matches(self, prefix):
+        """Names starting with prefix, in order."""
+        lo = bisect.bisect_left(self.names, prefix)
+        hi = lo
+        while hi < len(self.names) and self.names[hi].startswith(prefix):
+            hi += 1
+        return self.names[lo: hi]
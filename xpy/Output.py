@@ -0,0 +1,106 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Output sink for the console's messages and tracebacks.
+#
+# Writes go straight to the target, except within buffered(), which holds
+# them until the outermost buffered() exits and then sends them together,
+# e.g. one writev for a whole traceback rather than a write per line, so it
+# doesn't interleave with other writers a line at a time.
+#
+#   XPY.output = Output(Output.FileTarget('/tmp/xpy.log'))
+#   with XPY.output.buffered():
+#       XPY.hello('one\n')
+#       XPY.hello('two\n')
+#
+
+import os
+import collections
+import contextlib
+
+class Output(object):
+    # False to write every message as it comes, as before buffering
+    is_batching = True
+
+    def __init__(self, target = None):
+        self.target = target if target is not None else self.FdTarget(2)
+        self.parts = []
+        self.depth = 0
+
+    def write(self, data):
+        if self.depth and self.is_batching:
+            self.parts.append(data)
+        else:
+            self.target.writev([data])
+
+    @contextlib.contextmanager
+    def buffered(self):
+        """Hold writes until the outermost buffered() exits."""
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.flush()
+
+    def flush(self):
+        (parts, self.parts) = (self.parts, [])
+        if parts:
+            self.target.writev(parts)
+
+    class FdTarget(object):
+        """A file descriptor, written with writev."""
+        iov_max = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') and 'SC_IOV_MAX' in os.sysconf_names else 16
+
+        def __init__(self, fd):
+            self.fd = fd
+
+        def writev(self, parts):
+            if not hasattr(os, 'writev'):
+                self.write_all(b''.join(parts))
+                return
+            parts = list(parts)
+            while parts:
+                n = os.writev(self.fd, parts[: self.iov_max])
+                # drop what was written, keeping the rest of a part written partly
+                i = 0
+                while i < len(parts) and n >= len(parts[i]):
+                    n -= len(parts[i])
+                    i += 1
+                del parts[:i]
+                if n:
+                    parts[0] = parts[0][n:]
+
+        def write_all(self, data):
+            while data:
+                data = data[os.write(self.fd, data):]
+
+    class FileTarget(FdTarget):
+        """A file opened for appending, given its path."""
+        def __init__(self, path):
+            Output.FdTarget.__init__(self, os.open(os.path.expanduser(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644))
+
+        def close(self):
+            os.close(self.fd)
+
+    class SocketTarget(object):
+        """A connected socket, each flush sent whole."""
+        def __init__(self, sock):
+            self.sock = sock
+
+        def writev(self, parts):
+            self.sock.sendall(b''.join(parts))
+
+    class RingTarget(object):
+        """The last max_writes writes, kept in memory."""
+        def __init__(self, max_writes = 1000):
+            self.writes = collections.deque(maxlen = max_writes)
+
+        def writev(self, parts):
+            self.writes.append(b''.join(parts))
+
+        def getvalue(self):
+            return b''.join(self.writes)
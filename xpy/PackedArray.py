@@ -0,0 +1,73 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Fixed-width native-order values packed into bytes, and read back in place
+# from a buffer like an mmap.
+#
+# Python 3 reads them through memoryview.cast; python 2 has neither that nor
+# an array typecode for u64, so there each item is unpacked with struct.
+#
+#   data = PackedArray.pack('Q', [0, 5, 9])
+#   offsets = PackedArray.view(mm, header_size, 'Q', 3)
+#
+
+import struct
+
+class PackedArray(object):
+    is_cast = hasattr(memoryview, 'cast')
+
+    @staticmethod
+    def itemsize(fmt):
+        return struct.calcsize('=' + fmt)
+
+    @staticmethod
+    def pack(fmt, values):
+        """values as bytes, native byte order and standard sizes."""
+        return struct.pack('=%d%s' % (len(values), fmt), *values)
+
+    @staticmethod
+    def unpack(fmt, data):
+        """The values packed in data, as a list."""
+        return list(struct.unpack('=%d%s' % (len(data) // struct.calcsize('=' + fmt), fmt), data))
+
+    @classmethod
+    def view(self, buf, offset, fmt, count):
+        """A read-only sequence of the count fmt items at offset in buf, with release()."""
+        size = self.itemsize(fmt) * count
+        if self.is_cast:
+            return memoryview(buf)[offset: offset + size].cast(fmt)
+        return self(buf, offset, fmt, count)
+
+    @classmethod
+    def view_bytes(self, buf, offset, size):
+        """A read-only view of size bytes at offset in buf, sliced to bytes, with release()."""
+        if self.is_cast:
+            return memoryview(buf)[offset: offset + size]
+        return self(buf, offset, 's', size)
+
+    def __init__(self, buf, offset, fmt, count):
+        self.buf = buf
+        self.offset = offset
+        self.is_bytes = fmt == 's'
+        self.fmt = struct.Struct('=' + fmt)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            (start, stop, step) = i.indices(self.count)
+            if self.is_bytes:
+                return self.buf[self.offset + start: self.offset + max(start, stop)]
+            return [self[j] for j in range(start, stop, step)]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return self.fmt.unpack_from(self.buf, self.offset + i * self.fmt.size)[0]
+
+    def release(self):
+        self.buf = None
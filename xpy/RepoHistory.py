@@ -6,9 +6,28 @@
 #
 # History file is merged using git to keep all appends from multiple sources.
 #
+# Each host keeps one long-lived clone of the history repo which is brought
+# up to date with fetch, so a session only pays for the commits made since
+# the last one.  Consoles on the same host share that clone under a lock.
+#
+# Sessions journal their lines as they go (see HistoryJournal) and commit
+# each journal segment as its own file under journal/ in the repo, so a
+# commit only stores the lines typed.  Once enough segments pile up they are
+# compacted, i.e. folded into .pyhistory.
+#
+# History can be sharded by project (see shard_by), in which case a shard's
+# .pyhistory and journal live under shards/<id>/ and a console only loads
+# its own shard.  Search covers every shard.
+#
 
-import tempfile
 import os
+import re
+import time
+import errno
+import socket
+import hashlib
+import subprocess
+import threading
 
 from six.moves import map
 # from itertools import *
@@ -17,84 +36,509 @@ import readline
 
 import sys
 
-from .Text import Text
-from .File import File
+from .FileLock import FileLock
+from .GitRepo import GitRepo
+from .HistoryJournal import HistoryJournal
+from .HistoryIndex import HistoryIndex
+from .HistoryStore import HistoryStore
 
 class RepoHistory(object):
-    def __init__(self, repo_url):
-        self.tmpdir = tempfile.mkdtemp(prefix = 'hist.')
+    branch = 'master'
+    # seconds to keep retrying a branch update raced by other sessions
+    ref_lock_timeout = 10.0
+    # fold journal segments into .pyhistory once there are this many
+    compact_segments = 64
+    #
+    # retention policy applied when compacting and loading, see
+    # HistoryJournal.retain
+    #
+    max_entries = 100000
+    # seconds before the newest entry, or None to keep everything
+    max_age = None
+    is_dedup = True
+    # lines loaded into readline, or None for all; older ones are paged in
+    # from the store on demand
+    load_window = None
+    #
+    # commit from a detached worker so exiting the console doesn't wait on
+    # git; see detach
+    #
+    is_detached_commit = False
+    detached_retries = 30
+    #
+    # shard history by the git work tree of the current directory
+    # ('toplevel'), by the module the console started in ('module'), or not
+    # at all (None)
+    #
+    shard_by = None
+    # separates a journal segment's name from its shard id
+    shard_sep = '+'
+    #
+    # local repo maintenance, see maintain: once this many objects are loose,
+    # squash a branch longer than squash_commits and repack
+    #
+    repack_loose_objects = 1000
+    squash_commits = 500
+
+    def __init__(self, repo_url, shard_key = None):
         self.repo_url = os.path.expanduser(repo_url)
-        self.clone_path = os.path.join(self.tmpdir, os.path.basename(self.repo_url))
-        self.history_path = '.pyhistory'
+        self.host_path = os.path.join(self.get_cache_dir(), socket.gethostname())
+        self.clone_path = os.path.join(self.host_path, os.path.basename(self.repo_url.rstrip('/')))
+        self.lock_path = self.clone_path + '.lock'
+        # held by the one session committing for everyone on this host
+        self.flush_lock_path = self.clone_path + '.flush'
+        # detached commit worker output
+        self.log_path = self.clone_path + '.log'
+        # this console's shard, or None for the unsharded history
+        self.shard = self.get_shard_id(shard_key) if shard_key else None
+        (self.history_path, self.journal_path) = self.get_shard_paths(self.shard)
         self.history_abspath = os.path.join(self.clone_path, self.history_path)
+        self.journal_abspath = os.path.join(self.clone_path, self.journal_path)
+        # this host's segments which aren't committed yet
+        self.journal = HistoryJournal(self.clone_path + '.journal')
+        # trigram index for :hsearch
+        self.index = HistoryIndex(self.clone_path + '.index')
         self.attributes_file_path = os.path.join(self.clone_path, '.git/info/attributes')
         self.master_pid = os.getpid()
+        # snapshot handed from a push()ed child back to its parent
+        self.snapshot_path = self.clone_path + '.' + str(self.master_pid)
+        # the loaded history, including lines outside the readline window
+        self.store = HistoryStore(self.clone_path + '.store.' + str(self.master_pid))
+        # the newest load_window entries, loaded at startup before the clone is up to date
+        self.window_path = self.clone_path + '.window' + ('.' + self.shard if self.shard else '')
+        # (store, window lines) loaded by the clone thread, for splice_history
+        self.loaded = None
+        # number of readline entries at the front which came from the repo
+        self.loaded_count = 0
+        # number of this session's entries written to the journal
+        self.journaled_count = 0
+        # background clone state
+        self.clone_thread = None
+        self.git_errors = []
+        self.is_spliced = False
+
+    @staticmethod
+    def get_cache_dir():
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(cache_dir, 'xpy')
+
+    @staticmethod
+    def find_toplevel(path):
+        """The top of the git work tree containing path, or None."""
+        path = os.path.abspath(path)
+        while not os.path.exists(os.path.join(path, '.git')):
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+        return path
+
+    @classmethod
+    def get_shard_key(self, module_name = None):
+        """The shard key for a console started here in module_name, according to shard_by."""
+        if self.shard_by == 'toplevel':
+            return self.find_toplevel(os.getcwd())
+        elif self.shard_by == 'module':
+            return module_name
+        return None
+
+    @staticmethod
+    def get_shard_id(key):
+        """A readable file name unique to a shard key."""
+        name = re.sub('[^A-Za-z0-9_.-]', '_', os.path.basename(key.rstrip('/')) or 'root')[:40]
+        return name + '-' + hashlib.sha1(key.encode()).hexdigest()[:8]
+
+    @staticmethod
+    def get_shard_paths(shard):
+        """(history path, journal path) in the repo for a shard id, or None for the unsharded history."""
+        prefix = '' if shard is None else 'shards/' + shard + '/'
+        return (prefix + '.pyhistory', prefix + 'journal')
+
+    def get_segment_shard(self, name):
+        return name.split(self.shard_sep, 1)[1] if self.shard_sep in name else None
+
+    def get_shards(self):
+        """Shards in the clone or with segments on this host, None first."""
+        shards = set()
+        shards_path = os.path.join(self.clone_path, 'shards')
+        if os.path.isdir(shards_path):
+            shards.update(os.listdir(shards_path))
+        shards.update(self.get_segment_shard(name) for name in self.journal.closed_segments())
+        shards.discard(None)
+        return [None] + sorted(shards)
+
+    def get_history_items(self, start = 0):
+        """readline's history from the (0-based) index start on, reading only those items."""
+        # get_history_item is 1-based
+        return [readline.get_history_item(i) for i in range(start + 1, readline.get_current_history_length() + 1)]
 
     def clone(self):
-        if not os.path.exists(self.repo_url):
-            os.system(' '.join(['git init --bare ', self.repo_url]))
+        """
+        Load the window of history cached by the last session, then bring
+        the clone up to date and load its history in a background thread and
+        return immediately.
+
+        The console keeps prompting with the cached window; splice_history()
+        swaps in the fetched history once it's ready.
+        """
+        self.read_window()
+
+        self.journal.open(self.shard_sep + self.shard if self.shard else '')
+
+        self.clone_thread = threading.Thread(target = self._clone, name = 'RepoHistory.clone')
+        self.clone_thread.daemon = True
+        self.clone_thread.start()
+
+    def _clone(self):
+        # runs on the clone thread, so it must not touch readline or print
+        # over the prompt
+        if not os.path.isdir(self.host_path):
+            os.makedirs(self.host_path)
+
+        with FileLock(self.lock_path):
+            if not self.is_remote() and not os.path.exists(self.repo_url):
+                self._git(['init', '-q', '--bare', self.repo_url])
+                self._git(['--git-dir', self.repo_url, 'symbolic-ref', 'HEAD', 'refs/heads/' + self.branch])
+
+            is_cloned = os.path.isdir(os.path.join(self.clone_path, '.git'))
+            if not is_cloned:
+                self._git(['clone', '-q', self.repo_url, self.clone_path])
+            if os.path.isdir(os.path.join(self.clone_path, '.git')):
+                #
+                # union merge every shard's .pyhistory: a pattern without a
+                # slash matches at any depth.  Checked on every start, as
+                # clones made before sharding only name the root one
+                #
+                self.set_attribute(self.attributes_file_path, os.path.basename(self.history_path), ['merge=union'])
+            if is_cloned:
+                self.update()
+
+            self.load_history()
+
+    def update(self):
+        """Fetch and merge new commits into the clone.  Call with the lock held."""
+        #
+        # keep lines left behind by a session killed mid-commit, and any
+        # commits which failed to push, by merging rather than resetting
+        #
+        self._git(['commit', '-q', '-a', '-mwip'], self.clone_path, is_quiet = True)
+        self._git(['fetch', '-q', 'origin'], self.clone_path)
+        remote_branch = 'origin/' + self.branch
+        if not self._git(['rev-parse', '-q', '--verify', remote_branch], self.clone_path, is_quiet = True):
+            if self._git(['merge-base', 'HEAD', remote_branch], self.clone_path, is_quiet = True):
+                #
+                # the branch is unrelated to the clone's after a squash, and
+                # a union merge would repeat every line.  Only local repos
+                # are squashed, and their commits go straight into the repo,
+                # so the clone has nothing of its own to lose
+                #
+                self._git(['reset', '-q', '--hard', remote_branch], self.clone_path)
+                # drop the commits from before the squash
+                self._git(['reflog', 'expire', '--expire=now', '--all'], self.clone_path)
+                self._git(['gc', '-q', '--prune=now'], self.clone_path)
+            elif self._git(['merge', '-q', '-munion', remote_branch], self.clone_path):
+                # don't leave the clone mid-merge
+                self._git(['merge', '--abort'], self.clone_path, is_quiet = True)
+        self._git(['gc', '-q', '--auto'], self.clone_path)
+
+    def _git(self, args, cwd = None, is_quiet = False):
+        # subprocess.DEVNULL is python 3 only
+        with open(os.devnull, 'r+b') as null:
+            proc = subprocess.Popen(['git'] + args, cwd = cwd, stdin = null, stdout = null, stderr = subprocess.PIPE)
+            (_, err) = proc.communicate()
+        if proc.returncode and not is_quiet:
+            self.git_errors.append(' '.join(['git'] + args) + ': ' + err.decode('utf-8', 'replace').strip())
+        return proc.returncode
+
+    def show_errors(self):
+        for msg in self.git_errors:
+            print(msg)
+        self.git_errors[:] = []
+
+    def is_cloned(self):
+        return self.clone_thread is not None and not self.clone_thread.is_alive()
 
-        os.system(' '.join(['git clone ', self.repo_url, ' ', self.clone_path]))
+    def poll(self):
+        """
+        Splice the cloned history into readline if the clone has finished.
 
-        self.read_history()
+        Called from the prompt thread before each prompt.
+        """
+        self.journal_history()
+        if not self.is_spliced and self.is_cloned():
+            self.is_spliced = True
+            self.show_errors()
+            self.splice_history()
 
-    def read_history(self):
-        if os.path.exists(self.history_abspath):
+    def wait(self):
+        """Block until the clone is done and its history is spliced in."""
+        if self.clone_thread is not None:
+            self.clone_thread.join()
+        self.poll()
+
+    def splice_history(self):
+        """
+        Replace the repo history at the front of readline with the clone's
+        history, keeping the lines entered during this session after it.
+        """
+        if self.loaded is not None:
+            self.store.close()
+            (self.store, window) = self.loaded
+            self.loaded = None
+            typed = self.get_history_items(self.loaded_count)
             readline.clear_history()
-            readline.read_history_file(self.history_abspath)
-            #
-            # print(' '.join(['read history file', self.history_abspath]))
-            #
+            for line in window + typed:
+                readline.add_history(line)
+            self.loaded_count = len(window)
+
+    def list_sources(self, shard):
+        """
+        Paths of a shard's history in the clone as (.pyhistory path,
+        [(segment name, path)]): the journal segments in the repo, then any
+        segments on this host which didn't get committed, e.g. from a killed
+        session.
+        """
+        (history_path, journal_path) = self.get_shard_paths(shard)
+        journal_abspath = os.path.join(self.clone_path, journal_path)
+        segments = []
+        if os.path.isdir(journal_abspath):
+            segments = [(name, os.path.join(journal_abspath, name)) for name in sorted(os.listdir(journal_abspath))]
+        names = set(name for (name, path) in segments)
+        for name in self.journal.closed_segments():
+            if name not in names and self.get_segment_shard(name) == shard:
+                segments.append((name, os.path.join(self.journal.path, name)))
+        return (os.path.join(self.clone_path, history_path), segments)
+
+    @staticmethod
+    def read_file(path):
+        """The contents of path, or nothing if it doesn't exist."""
+        try:
+            with open(path, 'rb') as infile:
+                return infile.read()
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return b''
+
+    def read_sources(self, shard):
+        """A shard's history in the clone as (.pyhistory data, [(segment name, data)]), see list_sources."""
+        (history_abspath, segments) = self.list_sources(shard)
+        return (self.read_file(history_abspath), [(name, self.read_file(path)) for (name, path) in segments])
+
+    def read_entries(self):
+        """[(timestamp, line)] for this console's shard, oldest first, after retention."""
+        (base, segments) = self.read_sources(self.shard)
+        return self.retain(HistoryJournal.merge([('', base)] + segments))
+
+    def retain(self, entries):
+        return HistoryJournal.retain(entries, self.max_entries, self.max_age, self.is_dedup)
+
+    def get_window(self, entries):
+        return entries[len(entries) - self.load_window:] if self.load_window is not None else entries
+
+    def load_history(self):
+        """
+        Read and retain the clone's history into a new store, and cache its
+        newest load_window entries for the next session's startup.  Runs on
+        the clone thread with the lock held, so the prompt thread only has
+        the window to put in readline.
+        """
+        if os.path.exists(self.history_abspath) or os.path.isdir(self.journal_abspath):
+            entries = self.read_entries()
+            store = HistoryStore(self.store.path)
+            store.write([line for (t, line) in entries])
+            window = self.get_window(entries)
+            tmp_path = '%s.%d' % (self.window_path, os.getpid())
+            with open(tmp_path, 'wb') as outfile:
+                outfile.write(HistoryJournal.format(window))
+            os.rename(tmp_path, self.window_path)
+            self.loaded = (store, [line for (t, line) in window])
+
+    def read_window(self):
+        """Load the window cached by the last session into readline."""
+        window = self.get_window(HistoryJournal.parse(self.read_file(self.window_path)))
+        if window:
+            typed = self.get_history_items()
+            readline.clear_history()
+            for line in [line for (t, line) in window] + typed:
+                readline.add_history(line)
+        self.loaded_count = len(window)
+
+    def page_in(self, line_count):
+        """
+        Move up to line_count older lines from the store to the front of
+        readline and return how many were moved.
+        """
+        end = len(self.store) - self.loaded_count
+        older = self.store[max(0, end - line_count): end]
+        if older:
+            # readline can't insert at the front, so it's rebuilt
+            items = self.get_history_items()
+            readline.clear_history()
+            for line in older + items:
+                readline.add_history(line)
+            self.loaded_count += len(older)
+        return len(older)
+
+    def get_session_lines(self):
+        """The lines entered during this session."""
+        self.journal_history()
+        if self.journal.fd is not None:
+            return [line for (t, line) in HistoryJournal.parse(self.journal.read_segment(self.journal.name))]
+        else:
+            return self.get_history_items(self.loaded_count)
+
+    def get_last(self, line_count):
+        """The last line_count lines of history, read from the store and this session's journal."""
+        lines = self.get_session_lines()[-line_count:] if line_count else []
+        older = line_count - len(lines)
+        return self.store[max(0, len(self.store) - older):] + lines if older else lines
+
+    def journal_history(self):
+        """Append the lines entered since the last call to this session's journal segment."""
+        if self.journal.fd is not None:
+            lines = self.get_history_items(self.loaded_count + self.journaled_count)
+            self.journal.append(lines)
+            self.journaled_count += len(lines)
 
     # set a git attribute
     def set_attribute(self, attributes_file_path, path, attrs):
         # change merge driver to "union" for history files which tend to be
         # append-only from multiple sources.
 
-        eol = '\n'
+        # only needed on the clone thread, so keep them off the startup path
+        from .Text import Text
+        from .File import File
+
+        eol = b'\n'
 
         # write the following line to .git/info/attributes file if it isn't
         # already there.
         # .pyhistory merge=union
-        attr_line = ' '.join([path] + attrs) + eol
+        attr_line = ' '.join([path] + attrs).encode() + eol
 
         is_attr_present = False
         fd = os.open(attributes_file_path, os.O_RDWR | os.O_CREAT)
         try:
-            for line in Text.splitter(File.streamer(fd, 3), eol):
+            for line in Text.splitter(File.reader(fd), eol):
                 if line == attr_line:
-                    break
                     is_attr_present = True
+                    break
             if not is_attr_present:
-                os.write(fd, attr_line.encode())
+                os.lseek(fd, 0, os.SEEK_END)
+                os.write(fd, attr_line)
         finally:
             os.close(fd)
 
-    def write_history(self):
-        readline.write_history_file(self.history_abspath)
-        #
-        # print(' '.join(['wrote history file', self.history_abspath]))
-        #
+    def update_index(self, segments = None):
+        """
+        Bring the search index up to date with the clone, or only add
+        segments, [(name, data)], when given.
 
-    def commit(self):
-        if os.getpid() == self.master_pid:
-            self.write_history()
-
-            od = os.getcwd()
-            os.chdir(self.clone_path)
+        A .pyhistory is only read again once its size or mtime changes, and
+        only the journal segments not in the index yet are read, so an
+        up to date index costs a stat and a directory listing per shard.
+        """
+        with self.index.lock():
+            index = self.index.load()
+            is_changed = False
+            if segments is None:
+                indexed = index.sources()
+                segments = []
+                for shard in self.get_shards():
+                    (history_abspath, shard_segments) = self.list_sources(shard)
+                    history_path = self.get_shard_paths(shard)[0]
+                    stat = self.get_stat(history_abspath)
+                    if index.manifest['stats'].get(history_path) != stat:
+                        names = set(name for (name, path) in shard_segments)
+                        self.index_base(index, shard, self.read_file(history_abspath), names)
+                        index.manifest['stats'][history_path] = stat
+                        is_changed = True
+                    segments.extend((name, self.read_file(path)) for (name, path) in shard_segments if name not in indexed)
+            indexed = index.sources()
+            new_segments = [(name, HistoryJournal.parse(data)) for (name, data) in segments if name not in indexed]
+            if new_segments or is_changed:
+                index.add(new_segments)
+                index.save()
 
-            # update merge attribute
-            self.set_attribute(self.attributes_file_path, self.history_path, ['merge=union'])
+    @staticmethod
+    def get_stat(path):
+        """[size, mtime] of path, to tell when it changed, or None if it doesn't exist."""
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            return None
+        return [st.st_size, st.st_mtime]
 
-            os.system(' '.join(['git diff -b && git add ', self.history_path, ' && git commit -mwip ; git fetch && { [ -e ".git/refs/remotes/origin/HEAD" ] && git merge -munion || echo new master; } && git push']))
-            os.chdir(od)
+    def index_base(self, index, shard, base, names):
+        """
+        Index what was appended to a shard's .pyhistory data base, dropping
+        the journal segments compaction moved into it.  names are those of
+        the shard's current segments.
+        """
+        history_path = self.get_shard_paths(shard)[0]
+        (base_len, base_sha) = index.manifest['bases'].get(history_path, (0, None))
+        def is_journal(name):
+            return '@' not in name and self.get_segment_shard(name) == shard
+        if base_len > len(base) or (base_len and hashlib.sha1(base[:base_len]).hexdigest() != base_sha):
             #
-            print(' '.join(['removing', self.tmpdir]))
+            # .pyhistory was rewritten rather than appended to
             #
-            assert os.path.exists(self.tmpdir)
+            index.drop([name for name in index.sources() if name.startswith(history_path + '@') or is_journal(name)])
+            base_len = 0
+        if len(base) > base_len:
+            index.drop([name for name in index.sources() if is_journal(name) and name not in names])
+            index.add([(history_path + '@' + str(base_len), HistoryJournal.parse(base[base_len:]))])
+            index.manifest['bases'][history_path] = [len(base), hashlib.sha1(base).hexdigest()]
+
+    def search(self, pattern, limit = 20):
+        """
+        Ranked [(line, latest timestamp, count)] for lines in the merged
+        history and this session containing pattern.  See HistoryIndex.search.
+        """
+        self.update_index()
+        session = []
+        if self.journal.name is not None and os.path.exists(os.path.join(self.journal.path, self.journal.name)):
+            session = HistoryJournal.parse(self.journal.read_segment(self.journal.name))
+        return self.index.search(pattern, limit, session)
+
+    def save_snapshot(self):
+        """Write all of readline's history for the parent of a push()."""
+        self.journal_history()
+        readline.write_history_file(self.snapshot_path)
+
+    def load_snapshot(self):
+        """Replace readline's history with the snapshot saved by a push()ed child."""
+        if os.path.exists(self.snapshot_path):
+            readline.clear_history()
+            readline.read_history_file(self.snapshot_path)
+            os.unlink(self.snapshot_path)
             #
-            status = os.system(' '.join(['rm', '-rf', "'" + self.tmpdir + "'"]))
+            # the child journaled its own lines before exiting
             #
+            self.journaled_count = readline.get_current_history_length() - self.loaded_count
+
+    def is_remote(self):
+        """True for a URL, including scp-like host:path, rather than a local path."""
+        head = self.repo_url.split('/', 1)[0]
+        return '://' in self.repo_url or ':' in head
+
+    def is_local(self):
+        """True for a repo on this host, which is committed to without running git."""
+        return GitRepo.is_repo(self.repo_url)
+
+    def commit(self):
+        if os.getpid() == self.master_pid:
+            self.wait()
+
+            self.journal_history()
+            self.journal.close()
+
+            if self.is_detached_commit:
+                self.detach(self.commit_detached)
+            else:
+                self.flush()
+                self.show_errors()
         else:
             #
             print('not the master process--not committing')
@@ -102,3 +546,282 @@ class RepoHistory(object):
             pass
         pass
 
+    def commit_segments(self):
+        """
+        Commit every closed segment on this host, including ones left by
+        sessions which didn't get to commit their own.
+
+        Returns False if the commit failed; the segments are kept for the
+        next try.
+        """
+        with FileLock(self.lock_path):
+            names = self.journal.closed_segments()
+            segments = [(name, self.journal.read_segment(name)) for name in names]
+            segments = [(name, data) for (name, data) in segments if data]
+            if segments:
+                if self.is_local():
+                    is_committed = self.commit_local(segments)
+                    if is_committed:
+                        self.maintain()
+                else:
+                    is_committed = self.commit_remote(segments)
+            else:
+                is_committed = True
+            if is_committed:
+                self.journal.remove(names)
+                if segments:
+                    self.update_index(segments)
+        return is_committed
+
+    def flush(self):
+        """
+        Commit the closed segments of every session on this host in one
+        batch, unless another session is already flushing; it will pick up
+        this session's segment too.
+
+        Returns False if a commit failed.
+        """
+        lock = FileLock(self.flush_lock_path)
+        while self.journal.closed_segments():
+            if not lock.acquire(blocking = False):
+                break
+            try:
+                while self.journal.closed_segments():
+                    if not self.commit_segments():
+                        return False
+            finally:
+                lock.release()
+            #
+            # a segment closed just before the release may have been missed
+            # by this flusher and skipped by its own session, so look again
+            #
+        return True
+
+    def commit_detached(self):
+        """
+        Body of the detached commit worker: flush, backing off while the
+        commit fails.  Another session's flush may take this session's
+        segments first, which leaves nothing to do.
+        """
+        delay = 0.1
+        for attempt in range(self.detached_retries):
+            is_committed = self.flush()
+            self.show_errors()
+            if is_committed:
+                self.log('committed')
+                return True
+            time.sleep(delay)
+            delay = min(2 * delay, 10.0)
+        self.log('gave up; segments are kept for the next commit')
+        return False
+
+    def log(self, msg):
+        print(' '.join([time.strftime('%Y-%m-%d %H:%M:%S'), str(os.getpid()), self.repo_url, msg]))
+
+    def detach(self, fn):
+        """
+        Run fn in a double-forked worker, detached from the console's session
+        and terminal, with its output appended to log_path.  Returns at once.
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            # the intermediate child exits right after forking the worker
+            os.waitpid(pid, 0)
+            return
+        try:
+            os.setsid()
+            if os.fork():
+                os._exit(0)
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            null = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(null, 0)
+            os.dup2(fd, 1)
+            os.dup2(fd, 2)
+            #
+            # inherited descriptors would keep the console's flocks and pipes
+            # alive for as long as the worker runs
+            #
+            os.closerange(3, os.sysconf('SC_OPEN_MAX'))
+            sys.stdout = sys.stderr = os.fdopen(1, 'w')
+            fn()
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0)
+
+    def compact(self, base, journal):
+        """Fold journal segments, {name: data}, into the .pyhistory data base, applying retention."""
+        return HistoryJournal.format(self.retain(HistoryJournal.merge([('', base)] + list(journal.items()))))
+
+    def maintain(self):
+        """
+        Keep a local repo small: once repack_loose_objects objects are loose,
+        replace a branch longer than squash_commits with a single snapshot
+        commit of its tree, then repack, dropping objects only the old
+        commits used.
+
+        Remote repos are left alone, since squashing them would take a
+        force push; their clones are kept in check by git gc --auto.
+        """
+        repo = GitRepo(self.repo_url)
+        if repo.count_loose_objects() < self.repack_loose_objects:
+            return
+        #
+        # the lock lives in the repo, so it covers other hosts sharing it
+        #
+        lock = FileLock(os.path.join(repo.path, 'xpy-maintenance.lock'))
+        if not lock.acquire(blocking = False):
+            return
+        try:
+            ref = 'refs/heads/' + self.branch
+            head = repo.read_ref(ref)
+            if head and repo.count_commits(head, self.squash_commits + 1) > self.squash_commits:
+                snapshot = repo.write_commit(repo.read_commit(head)['tree'], [], 'squash')
+                # skipped if another session committed meanwhile
+                repo.update_ref(ref, snapshot, head)
+            self._git(['--git-dir', repo.path, 'repack', '-q', '-a', '-d'])
+            #
+            # loose objects written by sessions still committing are recent
+            #
+            self._git(['--git-dir', repo.path, 'prune', '--expire=1.hour.ago'])
+        finally:
+            lock.release()
+
+    def get_journal_changes(self, repo, head, shard, segments, blobs):
+        """
+        Tree changes, {path: sha | None}, adding a shard's segments,
+        [(name, data)], to its journal in the repo, or compacting the journal
+        once it's big enough.  Returns (changes, is_compacted).
+        """
+        (history_path, journal_path) = self.get_shard_paths(shard)
+        entry = repo.find(head, journal_path) if head else None
+        committed = repo.read_tree(entry[1]) if entry is not None else {}
+        changes = dict((journal_path + '/' + name, blobs[name]) for (name, data) in segments)
+        if len(set(committed) | set(name.encode() for (name, data) in segments)) < self.compact_segments:
+            return (changes, False)
+        journal = dict((name.decode(), repo.read_object(sha)[1]) for (name, (mode, sha)) in committed.items())
+        journal.update(segments)
+        base = (repo.read_path(head, history_path) if head else None) or b''
+        changes = {history_path: repo.write_object(b'blob', self.compact(base, journal))}
+        changes.update((journal_path + '/' + name, None) for name in journal)
+        return (changes, True)
+
+    def group_by_shard(self, segments):
+        """{shard: [(name, data)]} for segments, [(name, data)]."""
+        shards = {}
+        for (name, data) in segments:
+            shards.setdefault(self.get_segment_shard(name), []).append((name, data))
+        return shards
+
+    def commit_local(self, segments):
+        """
+        Add segments, [(name, data)], to their shards' journals directly in
+        the repo's object store and move the branch with a compare-and-swap,
+        retrying if another session got there first.
+        """
+        repo = GitRepo(self.repo_url)
+        ref = 'refs/heads/' + self.branch
+        deadline = time.time() + self.ref_lock_timeout
+        blobs = dict((name, repo.write_object(b'blob', data)) for (name, data) in segments)
+        shards = self.group_by_shard(segments)
+        while True:
+            head = repo.read_ref(ref)
+            tree = repo.read_commit(head)['tree'] if head else None
+            changes = {}
+            message = 'wip'
+            for (shard, shard_segments) in shards.items():
+                (shard_changes, is_compacted) = self.get_journal_changes(repo, head, shard, shard_segments, blobs)
+                changes.update(shard_changes)
+                if is_compacted:
+                    message = 'compact'
+            new_tree = repo.update_tree(tree, changes)
+            if new_tree == tree:
+                # already committed, e.g. by a worker killed before cleaning up
+                result = True
+                break
+            commit = repo.write_commit(new_tree, [head] if head else [], message)
+            if repo.update_ref(ref, commit, head):
+                result = True
+                break
+            if time.time() > deadline:
+                self.git_errors.append('timed out updating ' + ref + ' in ' + self.repo_url)
+                result = False
+                break
+            time.sleep(0.01)
+        return result
+
+    def compact_clone(self, shard, is_forced = False):
+        """
+        Fold a shard's journal in the clone into its .pyhistory once it's big
+        enough, or whenever is_forced.  Returns True if the clone changed.
+        """
+        (history_path, journal_path) = self.get_shard_paths(shard)
+        history_abspath = os.path.join(self.clone_path, history_path)
+        journal_abspath = os.path.join(self.clone_path, journal_path)
+        names = os.listdir(journal_abspath) if os.path.isdir(journal_abspath) else []
+        if len(names) < self.compact_segments and not is_forced:
+            return False
+        journal = {}
+        for name in names:
+            with open(os.path.join(journal_abspath, name), 'rb') as infile:
+                journal[name] = infile.read()
+        base = b''
+        if os.path.exists(history_abspath):
+            with open(history_abspath, 'rb') as infile:
+                base = infile.read()
+        data = self.compact(base, journal)
+        if data == base and not names:
+            return False
+        with open(history_abspath, 'wb') as outfile:
+            outfile.write(data)
+        for name in names:
+            os.unlink(os.path.join(journal_abspath, name))
+        return True
+
+    def commit_remote(self, segments):
+        """Commit segments, [(name, data)], in the clone and push.  Call with the lock held."""
+        self.update()
+        shards = self.group_by_shard(segments)
+        compacted = []
+        for (shard, shard_segments) in shards.items():
+            journal_abspath = os.path.join(self.clone_path, self.get_shard_paths(shard)[1])
+            if not os.path.isdir(journal_abspath):
+                os.makedirs(journal_abspath)
+            for (name, data) in shard_segments:
+                with open(os.path.join(journal_abspath, name), 'wb') as outfile:
+                    outfile.write(data)
+            if self.compact_clone(shard):
+                compacted.append(shard)
+        message = 'compact' if compacted else 'wip'
+        self._git(['add', '-A', '.'], self.clone_path)
+        if self._git(['diff', '--cached', '--quiet'], self.clone_path, is_quiet = True):
+            is_committed = not self._git(['commit', '-q', '-m' + message], self.clone_path)
+        else:
+            # already committed, e.g. by a worker killed before cleaning up
+            is_committed = True
+        #
+        # another host may have pushed since the fetch
+        #
+        push = ['push', '-q', 'origin', 'HEAD:' + self.branch]
+        if self._git(push, self.clone_path, is_quiet = True):
+            self._git(['fetch', '-q', 'origin'], self.clone_path)
+            if self._git(['merge', '-q', '-munion', 'origin/' + self.branch], self.clone_path):
+                self._git(['merge', '--abort'], self.clone_path, is_quiet = True)
+            #
+            # a union of two compactions keeps both sides' lines; compact
+            # again so both hosts end up with the same file
+            #
+            if [shard for shard in compacted if self.compact_clone(shard, is_forced = True)]:
+                self._git(['add', '-A', '.'], self.clone_path)
+                self._git(['commit', '-q', '-mcompact'], self.clone_path)
+            self._git(push, self.clone_path)
+        #
+        # once committed in the clone the segments will be pushed by a later
+        # session even if this push failed
+        #
+        return is_committed
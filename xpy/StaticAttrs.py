@@ -0,0 +1,135 @@
+#
+# Copyright 2016-2018 David J. Beal, All Rights Reserved
+#
+
+#
+# Attribute completion which never runs the objects' own code.
+#
+# rlcompleter evaluates the expression before the last dot and calls dir()
+# on the result, which can run properties, __getattr__ and __dir__, e.g. a
+# query on an ORM object or a round trip on a remote handle, on every Tab.
+# Here a dotted path of plain names is resolved with inspect.getattr_static,
+# stopping at anything that would need code to run, like a property, and
+# attribute names are read from the instance and class __dict__s.  The
+# names of a type's classes are cached, and re-read once any of their
+# __dict__s gains or loses a name.
+#
+
+import re
+import types
+import inspect
+import weakref
+
+try:
+    import builtins
+except ImportError as e:
+    import __builtin__ as builtins
+
+from .ObjectAsDict import ObjectAsDict
+
+class StaticAttrs(object):
+    path_pat = re.compile('^[A-Za-z_][A-Za-z0-9_]*(\\.[A-Za-z_][A-Za-z0-9_]*)*$')
+    # type -> (mro, [names in each class __dict__], names)
+    type_names = weakref.WeakKeyDictionary()
+    # descriptors whose __get__ is the interpreter's own, so safe to follow
+    safe_descriptors = (types.MemberDescriptorType,)
+    missing = object()
+
+    @classmethod
+    def lookup(self, obj, name):
+        """obj's attribute name, or missing if it's absent or can't be had without running code."""
+        try:
+            value = inspect.getattr_static(obj, name)
+        except AttributeError as e:
+            return self.missing
+        if isinstance(value, self.safe_descriptors) and not isinstance(obj, type):
+            try:
+                return value.__get__(obj, type(obj))
+            except AttributeError as e:
+                return self.missing
+        if isinstance(value, (staticmethod, classmethod)):
+            return value.__func__
+        if hasattr(type(value), '__get__') and not isinstance(value, (types.FunctionType, type)):
+            # a property or another descriptor with code of its own
+            return self.missing
+        return value
+
+    @classmethod
+    def resolve(self, path, namespaces):
+        """The object a dotted path of names refers to in namespaces or builtins, looked up statically, or missing."""
+        if not self.path_pat.match(path):
+            return self.missing
+        names = path.split('.')
+        obj = self.missing
+        for namespace in list(namespaces) + [builtins.__dict__]:
+            if isinstance(namespace, ObjectAsDict):
+                obj = self.lookup(namespace._obj, names[0])
+            elif type(namespace) is dict and names[0] in namespace:
+                obj = namespace[names[0]]
+            if obj is not self.missing:
+                break
+        for name in names[1:]:
+            if obj is self.missing:
+                break
+            obj = self.lookup(obj, name)
+        return obj
+
+    @classmethod
+    def mro(self, cls):
+        """cls.__mro__ as type defines it, whatever the metaclass does."""
+        return type.__dict__['__mro__'].__get__(cls)
+
+    @classmethod
+    def class_names(self, cls):
+        """Names in the __dict__s of cls and its bases, cached."""
+        mro = self.mro(cls)
+        cached = self.type_names.get(cls)
+        if cached is not None:
+            (cached_mro, keys, names) = cached
+            if cached_mro == mro and all(k == c.__dict__.keys() for (k, c) in zip(keys, mro)):
+                return names
+        keys = [frozenset(c.__dict__) for c in mro]
+        names = frozenset().union(*keys)
+        try:
+            self.type_names[cls] = (mro, keys, names)
+        except TypeError as e:
+            # not weakly referenceable
+            pass
+        return names
+
+    @classmethod
+    def names(self, obj):
+        """obj's attribute names, without calling dir()."""
+        names = set(self.class_names(type(obj)))
+        if isinstance(obj, type):
+            names.update(self.class_names(obj))
+        instance_dict = None
+        for cls in self.mro(type(obj)):
+            descriptor = cls.__dict__.get('__dict__')
+            if descriptor is not None:
+                # only the interpreter's own __dict__, not a property
+                if isinstance(descriptor, (types.GetSetDescriptorType, types.MemberDescriptorType)):
+                    try:
+                        instance_dict = descriptor.__get__(obj, type(obj))
+                    except (AttributeError, TypeError) as e:
+                        pass
+                break
+        if type(instance_dict) is dict:
+            names.update(name for name in instance_dict if isinstance(name, str))
+        return names
+
+    @classmethod
+    def complete(self, text, namespaces):
+        """Completions of text, an expression ending in a dot and an attribute prefix, like rlcompleter's."""
+        (expr, attr) = text.rsplit('.', 1)
+        obj = self.resolve(expr, namespaces)
+        if obj is self.missing:
+            return []
+        #
+        # hide private names until the prefix asks for them, as rlcompleter does
+        #
+        hidden = '_' if not attr else '__' if attr == '_' else None
+        return sorted(
+            expr + '.' + name for name in self.names(obj)
+            if name.startswith(attr) and not (hidden and name.startswith(hidden))
+        )
@@ -4,6 +4,7 @@
 
 from six.moves import map
 from cytoolz.curried import concat
+import re
 import sys
 
 class Text(object):
@@ -40,9 +41,79 @@ class Text(object):
         result = map(bytes, gc)
         return result
 
-    if sys.version_info.major == 2:
-        splitter = splitter2
+    @classmethod
+    def chunk_splitter(self, bufs, eol):
+        """
+        Split byte chunks into lines ending with eol, yielding the final
+        incomplete line last, like splitter3.  See LineSplitter.
+        """
+        splitter = LineSplitter(eol)
+        for buf in bufs:
+            for line in splitter.feed(buf):
+                yield line
+        for line in splitter.finish():
+            yield line
+
+    splitter = chunk_splitter
+
 
-    if sys.version_info.major == 3:
-        splitter = splitter3
+class LineSplitter(object):
+    """
+    Incremental state of Text.chunk_splitter, so blocking and async readers
+    can share it.
+
+    Works a chunk at a time, searching it in place and slicing; only the
+    tail of a line which runs past the end of a chunk is carried over, as a
+    list of pieces so long lines aren't copied repeatedly.  eol may be
+    several bytes long and straddle chunks.
+
+    Chunks may be memoryviews over a reused buffer, e.g. from File.reader,
+    in which case lines within a chunk are memoryviews too and only valid
+    until the next line is requested.
+    """
+    def __init__(self, eol):
+        self.eol = eol
+        self.pattern = re.compile(re.escape(eol))
+        # pieces of the line running past the previous chunk
+        self.parts = []
+        # its last len(eol) - 1 bytes, where a straddling eol would start
+        self.edge = eol[:0]
+
+    def feed(self, buf):
+        """Yield the lines completed by buf."""
+        eol = self.eol
+        n = len(eol)
+        empty = eol[:0]
+        parts = self.parts
+        start = 0
+        if parts and n > 1:
+            i = (self.edge + buf[:n - 1]).find(eol)
+            if i >= 0:
+                start = i + n - len(self.edge)
+                parts.append(buf[:start])
+                yield empty.join(parts)
+                del parts[:]
+                self.edge = empty
+        for match in self.pattern.finditer(buf, start):
+            end = match.end()
+            if parts:
+                parts.append(buf[start: end])
+                yield empty.join(parts)
+                del parts[:]
+                self.edge = empty
+            else:
+                yield buf[start: end]
+            start = end
+        if start < len(buf):
+            # copied, since buf may be reused for the next chunk
+            piece = bytes(buf[start:])
+            parts.append(piece)
+            if n > 1:
+                self.edge = (self.edge + piece[-(n - 1):])[-(n - 1):]
 
+    def finish(self):
+        """The final incomplete line, if any, as a list."""
+        lines = [self.eol[:0].join(self.parts)] if self.parts else []
+        del self.parts[:]
+        self.edge = self.eol[:0]
+        return lines
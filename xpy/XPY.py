@@ -5,29 +5,28 @@
 
 import sys
 import os
-import code
 import inspect
-import traceback
 import time
 import importlib
 
-from cytoolz import curry
-
-import greenlet
-
 from collections import OrderedDict
-import code
 #
 import re
 #
+from six.moves import input
+#
 
 class ResumEx(Exception):
-    pass
+    #
+    # greenlet is only imported once a resumable exception is raised
+    #
+    resumex = None
 
 #
 # resumable exception
 #
 def resumex(ex):
+    import greenlet
     while True:
         if isinstance(ex, Exception):
             XPY.print_exception(ex)
@@ -38,12 +37,13 @@ def resumex(ex):
         else:
             ex = greenlet.getcurrent().parent.switch()
 
-ResumEx.resumex = greenlet.greenlet(resumex)
-
 #
 # raise resumable exception
 #
 def rese(ex):
+    if ResumEx.resumex is None:
+        import greenlet
+        ResumEx.resumex = greenlet.greenlet(resumex)
     result = ResumEx.resumex.switch(ex)
     return result
 
@@ -104,31 +104,52 @@ if 0:
     #
 
 from .Colors import Colors
-from .Micros import Micros as M
-from .ConsoleImports import ConsoleImports
+from .LazyImport import LazyImport
 from .Anymethod import anymethod
-from .Clip import Clip
 from .ObjectAsDict import ObjectAsDict
+from .Output import Output
 
 class XPY(object):
     #
-    Clip = Clip
+    # helpers are imported on first use to keep console startup fast
+    #
+    Clip = LazyImport('.Clip', 'Clip')
+    ConsoleImports = LazyImport('.ConsoleImports', 'ConsoleImports')
     #
     xpy_ref_name = 'xpy'
     #
 
     # TODO: better handling of multiple console instances
     is_readline_busy = False
+    #
+    # set by __enter__
+    #
+    repo_history = None
+    history_records = None
+    #
+    # set by setup_tab_completion, see NameIndex
+    #
+    name_index = None
+    #
+    # shared by consoles, see ModuleIndex
+    #
+    module_index = None
+    #
+    # where hello and put send text, see Output
+    #
+    output = Output()
 
-    def __init__(self):
+    def __init__(self, module_name = None):
         # holders for the compiled code
         self.source = []
         self.code = None
+        # module the console was started in, for sharding history
+        self.module_name = module_name
 
     @classmethod
     def hello(self, text):
         """Encode and send text to the programmer."""
-        return M.w2(text.encode())
+        return self.output.write(text.encode())
 
     @classmethod
     def Hello(self, msg):
@@ -138,7 +159,7 @@ class XPY(object):
     @classmethod
     def put(self, *msg):
         """Send serialized message to the programmer."""
-        return M.w2((repr(msg) + '\n').encode())
+        return self.output.write((repr(msg) + '\n').encode())
 
     def __enter__(self):
         if self.is_readline_busy:
@@ -308,8 +329,30 @@ class XPY(object):
             else:
                 #
                 import rlcompleter
+                from .NameIndex import NameIndex
+                from .StaticAttrs import StaticAttrs
+                #
+                # names in the context, kept up to date after each statement
+                #
+                self.name_index = NameIndex([execution.g, execution.l])
+                #
+                # installed modules for import statements, refreshed in the background
+                #
+                if XPY.module_index is None:
+                    import socket
+                    from .RepoHistory import RepoHistory
+                    from .ModuleIndex import ModuleIndex
+                    XPY.module_index = ModuleIndex(os.path.join(RepoHistory.get_cache_dir(), socket.gethostname(), 'modules.json'))
+                    XPY.module_index.start_refresh()
                 #
                 def completer(self):
+                    #
+                    # matches for the text being completed, found when
+                    # readline asks for state 0 and handed out a state at a
+                    # time after that
+                    #
+                    cache = {'text': None, 'matches': []}
+                    #
                     def fn(text, state):
                         # combined namespace takes last precedence
                         # print('namespaces', namespaces)
@@ -317,22 +360,46 @@ class XPY(object):
                         assert type(state) is int
                         # print('state', state)
                         #
-                        combined = {}
-                        combined.update(execution.g)
-                        combined.update(execution.l)
-                        #
-                        comp = rlcompleter.Completer(combined)
-                        #
-                        # prime the matches
-                        #
-                        for i in range(state + 1):
-                            result = comp.complete(text, i)
-                        #
-                        # avoid completing a function identifier with an open parens
+                        if state == 0 or text != cache['text']:
+                            #
+                            line = readline.get_line_buffer()[:readline.get_endidx()]
+                            #
+                            # module names in import statements
+                            #
+                            matches = self.module_index.complete(line, text)
+                            #
+                            if matches is not None:
+                                pass
+                            elif '.' in text:
+                                #
+                                # attributes, found without evaluating anything
+                                #
+                                matches = StaticAttrs.complete(text, [execution.l, execution.g])
+                            else:
+                                #
+                                # only the names with the prefix, from the index
+                                #
+                                combined = {}
+                                for name in self.name_index.matches(text):
+                                    combined[name] = StaticAttrs.resolve(name, [execution.l, execution.g])
+                                #
+                                comp = rlcompleter.Completer(combined)
+                                #
+                                first = comp.complete(text, 0)
+                                #
+                                # on empty text it inserts a tab instead of matching
+                                #
+                                matches = getattr(comp, 'matches', [first] if first is not None else [])
+                            #
+                            # avoid completing a function identifier with an open parens
+                            #
+                            cache['matches'] = [match.rstrip('()') for match in matches]
+                            cache['text'] = text
+                            #
                         #
-                        result = result.rstrip('()')
+                        matches = cache['matches']
                         #
-                        return result
+                        return matches[state] if state < len(matches) else None
                     return fn
                     #
                 #
@@ -345,8 +412,16 @@ class XPY(object):
 
     def setup_history(self):
         from .RepoHistory import RepoHistory
-        self.repo_history = RepoHistory('~/.pyhist')
+        from .History import History
+        self.repo_history = RepoHistory('~/.pyhist', RepoHistory.get_shard_key(self.module_name))
         self.repo_history.clone()
+        History.repo_history = self.repo_history
+        from .HistoryRecords import HistoryRecords
+        self.history_records = HistoryRecords(os.path.join(self.repo_history.host_path, 'records'))
+
+    def poll_history(self):
+        if self.repo_history is not None:
+            self.repo_history.poll()
 
     def commit_history(self):
         if self.repo_history is not None:
@@ -354,6 +429,73 @@ class XPY(object):
         else:
             self.hello('not committing history\n')
 
+    def hmore(self, line_count):
+        """Page line_count older lines of history into readline."""
+        if self.repo_history is None:
+            self.hello('no history to page in\n')
+        else:
+            self.hello('paged in %d lines\n' % self.repo_history.page_in(int(line_count)))
+
+    def record_execution(self, execution):
+        """Log an executed statement with its timing to the history records."""
+        # nothing ran for an empty line
+        if self.history_records is not None and execution.source.strip():
+            try:
+                self.history_records.append(
+                    execution.t0,
+                    execution.t1 - execution.t0,
+                    execution.result,
+                    self.get_exec_name(execution),
+                    os.getcwd(),
+                    execution.source,
+                )
+            except (IOError, OSError) as e:
+                # e.g. a full disk; the console carries on without the record
+                self.hello(Colors.RED + 'statement not recorded: ' + str(e) + Colors.NORM + '\n')
+
+    def show_records(self, records):
+        with self.output.buffered():
+            for record in records:
+                when = time.strftime('%Y-%m-%d %H:%M', time.localtime(record.t0))
+                color = Colors.GREEN if record.ok else Colors.RED
+                self.hello('{}{} {}{:10.3f}s{} {} {}\n'.format(Colors.GREY, when, color, record.duration, Colors.BLUE, record.context, Colors.NORM + record.source))
+
+    def hslow(self, count = None, days = 7):
+        """Print the count, by default 10, slowest statements of the last days."""
+        if self.history_records is not None:
+            count = int(count) if count else 10
+            self.show_records(self.history_records.slowest(count, since = time.time() - days * 86400))
+
+    def hfail(self, context = None):
+        """Print the statements which raised in a module context, by default the current one."""
+        if self.history_records is not None:
+            if context is None and hasattr(self, 'execution'):
+                # the statement running this one
+                context = self.get_exec_name(self.execution)
+            self.show_records(self.history_records.failures(context))
+
+    def hsearch(self, pattern, limit = 20):
+        """Print the lines in the merged history containing pattern, best match first."""
+        if self.repo_history is None:
+            self.hello('no history to search\n')
+        else:
+            for (line, t, count) in self.repo_history.search(pattern, limit):
+                when = time.strftime('%Y-%m-%d %H:%M', time.localtime(t)) if t else ''
+                self.hello('{}{:16}{} {}\n'.format(Colors.GREY, when, Colors.NORM, line))
+
+    def bench(self, expr = None):
+        """Print the time an expression takes in the current namespace, or the bundled suite's times."""
+        from .Bench import Bench
+        if not expr:
+            results = Bench.run_suite()
+        else:
+            namespace = dict(self.execution.g)
+            if self.execution.l is not self.execution.g:
+                namespace.update(self.execution.l)
+            results = [Bench.run(expr, globals = namespace)]
+        for result in results:
+            self.hello(Bench.format(result) + '\n')
+
     @staticmethod
     def copy_from_history(line_count):
         l = readline.get_current_history_length()
@@ -453,9 +595,12 @@ class XPY(object):
         execution.exc_info = sys.exc_info()
         execution.path = '<xpy>'
         #
-        # for reading code input with readline support
+        # for reading code input with readline support: six's input is
+        # raw_input on python 2
         #
-        raw_input = code.InteractiveConsole().raw_input
+        # (same as code.InteractiveConsole().raw_input without importing code)
+        #
+        raw_input = input
 
         # readline can only support one instance at a time
 
@@ -486,6 +631,11 @@ class XPY(object):
                 self.input[:] = []
                 #
             else:
+                #
+                # pick up the background history clone once it's ready
+                #
+                self.poll_history()
+                #
                 try:
                     source = raw_input(prompt)
                 except KeyboardInterrupt as ke:
@@ -554,11 +704,16 @@ class XPY(object):
         #
         # function_name: (args, body),
         #
+        ':bench': (('*expr',), 'xpy.bench(*expr)', 'time an expression in ns/op, or the bundled suite with no expression'),
         ':cdmod': (('modname',), 'xpy.cdmod("modname")', 'change current module'),
         ':cd': (('modname',), ':cdmod modname', 'shorthand for :cdmod'),
         ':cliprun': ((), '_cliprun = xpy.Clip.run()', 'run source code in system clipboard'),
         ':help': ((), 'xpy.list_commands()', 'list commands'),
         ':histcopy': (('line_count',), 'xpy.Clip.copy_from_history(line_count)', 'copy a number of lines from history into clipboard'),
+        ':hmore': (('line_count',), 'xpy.hmore(line_count)', 'page older history into readline'),
+        ':hslow': (('*count',), 'xpy.hslow(*count)', 'list the slowest statements this week, 10 unless a count is given'),
+        ':hfail': ((), 'xpy.hfail()', 'list failed statements in the current module'),
+        ':hsearch': (('*pattern',), 'xpy.hsearch(*pattern)', 'search merged history for lines containing pattern'),
         ':histpaste': ((), 'xpy.Clip.paste_into_history()', 'paste system clipboard source into history'),
         ':reload': ((), 'xpy.reload()', 'reload current module'),
         ':r': ((), ':reload', 'shorthand for :reload'),
@@ -586,7 +741,16 @@ class XPY(object):
             #
             fn = match.group(0)
             #
-            args = source[len(fn):].split()
+            sig = self._substitutions[fn][0]
+            #
+            # a final argument named *name takes the rest of the line, if any
+            #
+            if sig and sig[-1].startswith('*'):
+                args = source[len(fn):].strip().split(None, len(sig) - 1)
+                if len(args) == len(sig) - 1:
+                    args.append('')
+            else:
+                args = source[len(fn):].split()
             #
             cmd = (fn, args)
             #
@@ -627,7 +791,10 @@ class XPY(object):
                     #
                     if len(args) == len(sig):
                         for (s, a) in zip(sig, args):
-                            expansion = expansion.replace(s, a)
+                            #
+                            # the rest of the line goes in as a string literal
+                            #
+                            expansion = expansion.replace(s, repr(a) if s.startswith('*') else a)
                             #
                         #
                         #print('expansion', expansion)
@@ -894,6 +1061,11 @@ class XPY(object):
                 del self.execution
                 execution.t1 = time.time()
             #
+            self.record_execution(execution)
+            #
+            if self.name_index is not None:
+                self.name_index.update()
+            #
             # post execution pollution
             #
             if execution.is_polluted:
@@ -955,7 +1127,8 @@ class XPY(object):
             if type(lnotab) is str:
                 lnotab = [ord(l) for l in lnotab]
             frame_line_count = sum([lnotab[i * 2 + 1] for i in range(len(lnotab) // 2)]) + 1
-            for i in range(firstlineno, firstlineno + frame_line_count):
+            # newer co_lnotab deltas can be negative, so this can overshoot
+            for i in range(firstlineno, min(firstlineno + frame_line_count, len(lines) + 1)):
                 result.append(lines[i - 1])
             result = [result, firstlineno]
 
@@ -967,7 +1140,8 @@ class XPY(object):
     @anymethod
     def print_traceback(self, exc_info = None, max_context_lines = 1):
         top = self.get_traceback_top(exc_info)
-        self.print_backframes(top, max_context_lines = max_context_lines)
+        with self.output.buffered():
+            self.print_backframes(top, max_context_lines = max_context_lines)
 
     @anymethod
     def get_traceback_top(self, exc_info = None):
@@ -1087,18 +1261,22 @@ class XPY(object):
         #
         path = self.get_frame_path(top)
         #
-        if path != execution.path:
+        # one write for the whole traceback
+        #
+        with self.output.buffered():
             #
-            self.print_traceback(exc_info, max_context_lines = 1)
-            # trace = ''.join([Colors.WHITE, path, ': ', str(top.f_lineno), ' ', Colors.NORM])
+            if path != execution.path:
+                #
+                self.print_traceback(exc_info, max_context_lines = 1)
+                # trace = ''.join([Colors.WHITE, path, ': ', str(top.f_lineno), ' ', Colors.NORM])
+                #
+                # self.hello(trace + '\n')
+                #
             #
-            # self.hello(trace + '\n')
+            (_, ex, tb) = exc_info
+            #
+            self.print_exception(ex)
             #
-        #
-        (_, ex, tb) = exc_info
-        #
-        self.print_exception(ex)
-        #
     #
     @classmethod
     def print_exception(self, ex = None):
@@ -1106,12 +1284,13 @@ class XPY(object):
             exc_info = sys.exc_info()
             (_, ex, tb) = exc_info
         #
-        self.hello(Colors.RED + str(ex.__class__.__module__ + '.' + ex.__class__.__name__) + Colors.NORM + ((': ' + Colors.YELLOW + str(ex) + Colors.NORM) if str(ex) else '') + '\n')
-        #
-        if isinstance(ex, SyntaxError):
-            self.print_syntax_error(ex)
+        with self.output.buffered():
+            self.hello(Colors.RED + str(ex.__class__.__module__ + '.' + ex.__class__.__name__) + Colors.NORM + ((': ' + Colors.YELLOW + str(ex) + Colors.NORM) if str(ex) else '') + '\n')
+            #
+            if isinstance(ex, SyntaxError):
+                self.print_syntax_error(ex)
+                #
             #
-        #
     #
     @classmethod
     def print_syntax_error(self, ex):
@@ -1127,7 +1306,9 @@ class XPY(object):
         #
         # be nice and add some gadgets to the console namespace
         #
-        pollution = OrderedDict(filter(lambda kv: not kv[0].startswith('_'), ConsoleImports.__dict__.items()))
+        ConsoleImports = self.ConsoleImports
+        #
+        pollution = OrderedDict((k, getattr(ConsoleImports, k)) for k in LazyImport.names(ConsoleImports))
         #
         # pollute locals
         #
@@ -1434,7 +1615,7 @@ class XPY(object):
         """
         invoked by child when pushed child process exits
         """
-        self.repo_history.write_history()
+        self.repo_history.save_snapshot()
         #
         # print('child wrote history file')
         #
@@ -1445,11 +1626,16 @@ class XPY(object):
         fork and have parent wait
         used to save and restore state 
         """
+        #
+        # the child's history is read back, so don't fork mid-clone
+        #
+        self.repo_history.wait()
+        #
         pid = os.fork()
         if pid:
             os.waitpid(pid, 0)
             #
-            self.repo_history.read_history()
+            self.repo_history.load_snapshot()
             #
             # print('parent read history file')
             #
@@ -1459,7 +1645,7 @@ class XPY(object):
             #
             self.execution.level += 1
             #
-            # self.repo_history.write_history()
+            # self.repo_history.save_snapshot()
 
 def start_console(with_globals = None, with_locals = None, is_polluted = False):
     """
@@ -1478,7 +1664,7 @@ def start_console(with_globals = None, with_locals = None, is_polluted = False):
     if with_locals is None:
         with_locals = frame.f_locals
 
-    with XPY() as xpy:
+    with XPY(with_globals.get('__name__')) as xpy:
         #
         result = xpy.run(with_globals, with_locals, is_polluted = is_polluted)
         #
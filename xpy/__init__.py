@@ -3,5 +3,39 @@
 # Copyright 2016-2018 David J. Beal, All Rights Reserved
 #
 
-from .XPY import *
+import sys
 
+#
+# Names exported by the package, resolved on first use so that importing xpy
+# (and reaching the first console prompt) doesn't pay for every helper module.
+#
+_lazy_names = {
+    'XPY': ('.XPY', 'XPY'),
+    'Main': ('.XPY', 'Main'),
+    'ResumEx': ('.XPY', 'ResumEx'),
+    'resumex': ('.XPY', 'resumex'),
+    'rese': ('.XPY', 'rese'),
+    'start_console': ('.XPY', 'start_console'),
+    'xpy_start_console': ('.XPY', 'xpy_start_console'),
+    'Colors': ('.Colors', 'Colors'),
+    'M': ('.Micros', 'Micros'),
+    'ConsoleImports': ('.ConsoleImports', 'ConsoleImports'),
+    'anymethod': ('.Anymethod', 'anymethod'),
+    'Clip': ('.Clip', 'Clip'),
+    'ObjectAsDict': ('.ObjectAsDict', 'ObjectAsDict'),
+}
+
+if sys.version_info >= (3, 7):
+    from .LazyImport import LazyImport
+
+    __all__ = list(_lazy_names)
+
+    __getattr__ = LazyImport.module_getattr(__name__, _lazy_names)
+
+    def __dir__():
+        return sorted(set(globals()) | set(_lazy_names))
+else:
+    #
+    # no module __getattr__ before python 3.7
+    #
+    from .XPY import *